@@ -11,14 +11,14 @@ Improvements:
 
 from __future__ import annotations
 import re
-from typing import Any, Optional, Tuple
+from typing import Any, List, Optional, Tuple
 import json
 
 from ai.sentiment import SentimentEngine
 from ai.nlp import TypeClassifier, LanguageDetector
 from ai.summarizer import SimpleSummarizer, RecommendationEngine
 from ai.geo import GeoNormalizer
-from ai.llm_client import get_client
+from ai.llm_client import get_client, get_async_client
 
 
 _HIGH_PRIORITY_TYPES: frozenset[str] = frozenset({
@@ -36,6 +36,7 @@ _PRIORITY_MAX: int = 10
 
 LLM_MODEL = "upstage/solar-pro-3:free"
 LLM_CONFIDENCE_THRESHOLD = 4  # if rule-based score < this → try LLM
+MAX_SINGLE_RETRIES = 3  # per batch: tickets the batch reply skipped, re-asked one by one
 
 SUMMARY_SYSTEM_PROMPT = """
 Ты — опытный аналитик колл-центра Freedom Finance.
@@ -56,6 +57,27 @@ SUMMARY_SYSTEM_PROMPT = """
 - Профессиональный деловой стиль
 """
 
+BATCH_SUMMARY_SYSTEM_PROMPT = """
+Ты — опытный аналитик колл-центра Freedom Finance.
+
+Тебе дан JSON-массив обращений клиентов вида [{"i": номер, "text": текст}, ...].
+Для КАЖДОГО обращения напиши summary и recommendation и верни СТРОГО JSON-массив
+без лишнего текста, по одному объекту на обращение, с тем же номером "i":
+
+[
+  {"i": 0, "summary": "краткая суть обращения в 1-2 предложениях", "recommendation": "конкретные шаги для менеджера"},
+  ...
+]
+
+ВАЖНО:
+- Только JSON-массив, никакого текста до или после
+- Никаких markdown-блоков
+- summary не длиннее 250 символов
+- recommendation не длиннее 300 символов
+- Язык ответа — русский
+- Профессиональный деловой стиль
+"""
+
 
 def _clamp(value: int, lo: int, hi: int) -> int:
     return max(lo, min(hi, value))
@@ -94,58 +116,143 @@ def _normalize_segment(segment: str) -> str:
     return s
 
 
+def _summary_request(text: str) -> dict[str, Any]:
+    return {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": text[:2000]},
+        ],
+        "temperature": 0.2,
+        "max_tokens": 600,
+        "timeout": 15,
+    }
+
+
+def _parse_summary(raw: str) -> Optional[dict]:
+    match = re.search(r"```(?:json)?\s*([\s\S]+?)```", raw)
+    json_str = match.group(1).strip() if match else raw.strip()
+    match2 = re.search(r"\{[\s\S]+?\}", json_str)
+    if match2:
+        json_str = match2.group(0)
+    json_str = _try_repair_json(json_str)
+    data = json.loads(json_str)
+    summary = _safe_str(data.get("summary"))
+    recommendation = _safe_str(data.get("recommendation"))
+    if summary and recommendation:
+        return {"summary": summary, "recommendation": recommendation}
+    return None
+
+
+def _batch_summary_request(texts: List[str]) -> dict[str, Any]:
+    payload = json.dumps(
+        [{"i": i, "text": t[:2000]} for i, t in enumerate(texts)],
+        ensure_ascii=False,
+    )
+    return {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": BATCH_SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": payload},
+        ],
+        "temperature": 0.2,
+        "max_tokens": 300 * len(texts),
+        "timeout": 15 + 5 * len(texts),
+    }
+
+
+def _parse_summaries(raw: str, n: int) -> List[Optional[dict]]:
+    """Items the model skipped come back as None."""
+    results: List[Optional[dict]] = [None] * n
+    # A truncated reply may lose the closing fence and bracket — _try_repair_json restores them
+    match = re.search(r"```(?:json)?\s*([\s\S]+?)(?:```|$)", raw)
+    json_str = match.group(1).strip() if match else raw.strip()
+    match2 = re.search(r"\[[\s\S]*\]", json_str) or re.search(r"\[[\s\S]*", json_str)
+    if match2:
+        json_str = match2.group(0)
+    items = json.loads(_try_repair_json(json_str))
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        i = item.get("i")
+        summary = _safe_str(item.get("summary"))
+        recommendation = _safe_str(item.get("recommendation"))
+        if isinstance(i, int) and 0 <= i < n and summary and recommendation:
+            results[i] = {"summary": summary, "recommendation": recommendation}
+    return results
+
+
 def _get_llm_summary(text: str) -> Optional[dict]:
     client = get_client()
     if client is None:
         return None
 
     try:
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[
-                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
-                {"role": "user", "content": text[:2000]},
-            ],
-            temperature=0.2,
-            max_tokens=600,
-            timeout=15,
-        )
-        raw = response.choices[0].message.content or ""
-        match = re.search(r"```(?:json)?\s*([\s\S]+?)```", raw)
-        json_str = match.group(1).strip() if match else raw.strip()
-        match2 = re.search(r"\{[\s\S]+?\}", json_str)
-        if match2:
-            json_str = match2.group(0)
-        json_str = _try_repair_json(json_str)
-        data = json.loads(json_str)
-        summary = _safe_str(data.get("summary"))
-        recommendation = _safe_str(data.get("recommendation"))
-        if summary and recommendation:
-            return {"summary": summary, "recommendation": recommendation}
+        response = client.chat.completions.create(**_summary_request(text))
+        return _parse_summary(response.choices[0].message.content or "")
+    except Exception as e:
+        print(f"[LLM] summary error: {type(e).__name__}: {e}")
+    return None
+
+
+async def _aget_llm_summary(text: str) -> Optional[dict]:
+    client = get_async_client()
+    if client is None:
+        return None
+
+    try:
+        response = await client.chat.completions.create(**_summary_request(text))
+        return _parse_summary(response.choices[0].message.content or "")
     except Exception as e:
         print(f"[LLM] summary error: {type(e).__name__}: {e}")
     return None
 
 
+async def _aget_llm_summaries(texts: List[str]) -> Optional[List[Optional[dict]]]:
+    """
+    One LLM call for a whole batch; items the model skipped come back as None.
+    Returns None if the call itself failed (no client, error, unparsable reply).
+    """
+    client = get_async_client()
+    if client is None or not texts:
+        return None
+
+    try:
+        response = await client.chat.completions.create(**_batch_summary_request(texts))
+        return _parse_summaries(response.choices[0].message.content or "", len(texts))
+    except Exception as e:
+        print(f"[LLM] batch summary error: {type(e).__name__}: {e}")
+    return None
+
+
 def _try_repair_json(s: str) -> str:
+    """Close a truncated string and any unclosed objects/arrays, innermost first."""
     s = s.strip()
     if not s:
         return s
+    closers: List[str] = []
     in_string = False
     i = 0
     while i < len(s):
         c = s[i]
-        if c == '\\' and in_string:
-            i += 2
-            continue
-        if c == '"':
-            in_string = not in_string
+        if in_string:
+            if c == '\\':
+                i += 2
+                continue
+            if c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '{[':
+            closers.append('}' if c == '{' else ']')
+        elif c in '}]' and closers:
+            closers.pop()
         i += 1
     if in_string:
         s += '"'
-    if not s.endswith('}'):
-        s += '}'
-    return s
+    if closers:
+        s = s.rstrip().rstrip(',')
+    return s + ''.join(reversed(closers))
 
 
 class TicketEnricher:
@@ -158,6 +265,33 @@ class TicketEnricher:
         self._geo = GeoNormalizer()
 
     def enrich(self, ticket: dict[str, Any]) -> dict[str, Any]:
+        text: str = _safe_str(ticket.get("text", ""))
+        # LLM for summary + recommendation (and type if low confidence)
+        return self._build(ticket, _get_llm_summary(text))
+
+    def enrich_with_summary(self, ticket: dict[str, Any], llm: Optional[dict]) -> dict[str, Any]:
+        """enrich() with an LLM summary obtained elsewhere (e.g. ai_cache); rule-based fields are recomputed."""
+        return self._build(ticket, llm)
+
+    async def aenrich_batch(self, tickets: List[dict[str, Any]]) -> List[dict[str, Any]]:
+        """
+        Same as enrich() for every ticket, but summaries come from a single
+        LLM request per batch. If the reply skipped a few tickets, up to
+        MAX_SINGLE_RETRIES of them are re-asked one by one; the rest, and the
+        whole batch when the request failed, fall back to the rule-based
+        summarizer without further LLM calls.
+        """
+        texts = [_safe_str(t.get("text", "")) for t in tickets]
+        llm = await _aget_llm_summaries(texts)
+        if llm is None:
+            llm = [None] * len(texts)
+        else:
+            missing = [i for i, r in enumerate(llm) if r is None]
+            for i in missing[:MAX_SINGLE_RETRIES]:
+                llm[i] = await _aget_llm_summary(texts[i])
+        return [self._build(t, r) for t, r in zip(tickets, llm)]
+
+    def _build(self, ticket: dict[str, Any], llm: Optional[dict]) -> dict[str, Any]:
         text: str = _safe_str(ticket.get("text", ""))
         city_raw: str = _safe_str(ticket.get("city", ""))
         region: str = _safe_str(ticket.get("region", ""))
@@ -175,9 +309,6 @@ class TicketEnricher:
         # Geocode with region fallback
         lat, lon = self._geo.geocode(city, region)
 
-        # LLM for summary + recommendation (and type if low confidence)
-        llm = _get_llm_summary(text)
-
         if llm:
             summary = llm["summary"]
             recommendation = llm["recommendation"]
@@ -194,6 +325,7 @@ class TicketEnricher:
             "recommendation": recommendation,
             "lat":            lat,
             "lon":            lon,
+            "llm_used":       llm is not None,
         }
 
     @staticmethod
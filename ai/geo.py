@@ -13,7 +13,7 @@ from __future__ import annotations
 
 import math
 import re
-from typing import Final, Optional, Tuple
+from typing import Dict, Final, Iterable, Optional, Tuple
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -351,19 +351,23 @@ class GeoNormalizer:
             s = bracket_match.group(1).strip()
 
         s = s.lower()
+        # Latin-only input: the letter/dash replacements below are no-ops
+        is_ascii = s.isascii()
         s = self._PREFIX_RE.sub("", s)
         s = self._REGION_SUFFIX.sub("", s).strip()
-        s = s.replace("ё", "е")
-        s = s.replace("—", "-").replace("–", "-")
+        if not is_ascii:
+            s = s.replace("ё", "е")
+            s = s.replace("—", "-").replace("–", "-")
         s = self._TRASH_RE.sub(" ", s)
         s = self._DASH_SP_RE.sub("-", s)
         s = self._SPACES_RE.sub(" ", s).strip()
 
         # Kazakh → Russian letter mapping
-        s = (s
-             .replace("қ", "к").replace("ө", "о").replace("ү", "у")
-             .replace("ұ", "у").replace("ә", "а").replace("ң", "н")
-             .replace("ғ", "г").replace("һ", "х").replace("і", "и"))
+        if not is_ascii:
+            s = (s
+                 .replace("қ", "к").replace("ө", "о").replace("ү", "у")
+                 .replace("ұ", "у").replace("ә", "а").replace("ң", "н")
+                 .replace("ғ", "г").replace("һ", "х").replace("і", "и"))
 
         return s
 
@@ -406,6 +410,12 @@ class GeoNormalizer:
 
         return None, None
 
+    def geocode_many(
+        self, pairs: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Tuple[Optional[float], Optional[float]]]:
+        """Geocode (city, region) pairs, each distinct pair only once."""
+        return {pair: self.geocode(*pair) for pair in dict.fromkeys(pairs)}
+
     def _geocode_region(self, region: str) -> Tuple[Optional[float], Optional[float]]:
         """Try to get centroid from region name."""
         if not region:
@@ -1,13 +1,22 @@
 # ai/llm_client.py
 
+import asyncio
 import os
 
 _openai_available = False
 _client = None
 _last_key = None  # запоминаем с каким ключом создан клиент
+_async_client = None
+_async_key = None  # (ключ, event loop) — async-клиент привязан к своему циклу
+
+# Пул соединений клиентов: один TCP/TLS пул на все LLM-запросы процесса.
+# Не ниже значений по умолчанию в openai SDK (1000 / 100).
+MAX_CONNECTIONS = 1000
+MAX_KEEPALIVE = 100
 
 try:
-    from openai import OpenAI
+    import httpx
+    from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
     _openai_available = True
 except ImportError:
     print("[LLM] 'openai' package not installed — LLM disabled, fallback to rule-based NLP")
@@ -33,10 +42,60 @@ def get_client():
     base_url = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
 
     try:
-        _client = OpenAI(api_key=api_key, base_url=base_url)
+        _client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            # DefaultHttpxClient сохраняет таймаут, редиректы и транспорт SDK
+            http_client=DefaultHttpxClient(limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            )),
+        )
         _last_key = api_key
         print(f"[LLM] Client initialized → {base_url}")
         return _client
     except Exception as e:
         print(f"[LLM] Client init failed: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_async_client():
+    """Как get_client(), но AsyncOpenAI — один на ключ и текущий event loop."""
+    global _async_client, _async_key
+
+    if not _openai_available:
+        return None
+
+    api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
+
+    if not api_key:
+        _async_client = None
+        _async_key = None
+        return None
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    # Переиспользуем клиент если ключ и цикл не изменились
+    if _async_client is not None and _async_key == (api_key, loop):
+        return _async_client
+
+    base_url = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+
+    try:
+        _async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            )),
+        )
+        _async_key = (api_key, loop)
+        print(f"[LLM] Async client initialized → {base_url}")
+        return _async_client
+    except Exception as e:
+        print(f"[LLM] Async client init failed: {e}")
+        return None
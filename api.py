@@ -61,10 +61,12 @@ def query_df(sql: str, params=None) -> pd.DataFrame:
 
 
 def safe_serialize(df: pd.DataFrame) -> list:
+    columns = list(df.columns)
     records = []
-    for _, row in df.iterrows():
+    # itertuples отдаёт обычные кортежи — без Series на каждую строку
+    for values in df.itertuples(index=False, name=None):
         record = {}
-        for col, val in row.items():
+        for col, val in zip(columns, values):
             if pd.isna(val) if not isinstance(val, (list, dict)) else False:
                 record[col] = None
             elif hasattr(val, 'isoformat'):
@@ -3,13 +3,34 @@
 Все операции с PostgreSQL.
 """
 
+import io
 import os
+import atexit
+import contextlib
+import re
 import json
+import struct
+import datetime
+import threading
+import numpy as np
 import pandas as pd
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from dotenv import load_dotenv
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import pyarrow  # noqa: F401 — движок pd.read_csv(engine="pyarrow")
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 load_dotenv()
 
 # ── Справочник адресов офисов (fallback если в CSV пусто) ──
@@ -33,28 +54,34 @@ _OFFICE_ADDRESSES = {
 }
 
 
+_PREFIX_RE = re.compile(r"^(г\.|город |city )\s*")
+
+
+def _normalize_office_key(office_name: str) -> str:
+    """Приводит название офиса к ключу справочника: без префикса, ё → е."""
+    return _PREFIX_RE.sub("", office_name.lower().strip()).replace("ё", "е")
+
+
+# Ключи справочника нормализуются один раз при импорте модуля
+_NORMALIZED_OFFICE_ADDRESSES = {
+    _normalize_office_key(k): v for k, v in _OFFICE_ADDRESSES.items()
+}
+
+
 def _resolve_address(office_name: str, csv_address: str) -> str:
     """Возвращает адрес из CSV если он не пустой, иначе из справочника."""
     addr = str(csv_address).strip() if csv_address else ""
     if addr and addr.lower() not in ("nan", "none", ""):
         return addr
-    # Ищем по нормализованному ключу
-    key = office_name.lower().strip()
-    # Убираем префиксы
-    for prefix in ("г.", "город ", "city "):
-        if key.startswith(prefix):
-            key = key[len(prefix):].strip()
-    # Замена ё → е для сравнения
-    key = key.replace("ё", "е")
-    return _OFFICE_ADDRESSES.get(key, "")
+    return _NORMALIZED_OFFICE_ADDRESSES.get(_normalize_office_key(office_name), "")
 
 
 # ───────────────────────────────────────────────
 # Подключение
 # ───────────────────────────────────────────────
 
-def get_connection():
-    return psycopg2.connect(
+def _connect_params() -> dict:
+    return dict(
         host     = os.getenv("DB_HOST",     "localhost"),
         port     = int(os.getenv("DB_PORT", "5432")),
         dbname   = os.getenv("DB_NAME",     "fire_db"),
@@ -63,25 +90,207 @@ def get_connection():
     )
 
 
+def get_connection():
+    """Отдельное соединение (закрывать самому). Функции модуля берут его из пула."""
+    return psycopg2.connect(**_connect_params())
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Ленивый пул соединений — не платим за TCP + auth на каждый вызов."""
+    global _POOL
+    if _POOL is None:
+        # Первый вызов может прийти сразу из нескольких потоков (API, дашборд) —
+        # без блокировки создадутся два пула и один утечёт
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = psycopg2.pool.ThreadedConnectionPool(1, 8, **_connect_params())
+    return _POOL
+
+
+atexit.register(lambda: _POOL and _POOL.closeall())
+
+
+@contextlib.contextmanager
+def pooled_connection(conn=None):
+    """
+    Соединение из пула на время блока. Если conn передан — используется он
+    (так run.py проводит все шаги через одно соединение).
+    """
+    if conn is not None:
+        yield conn
+        return
+    conn = _pool().getconn()
+    try:
+        yield conn
+    finally:
+        _pool().putconn(conn)
+
+
+@contextlib.contextmanager
+def _read_only(conn=None):
+    """Курсор для чтения в autocommit — без лишних BEGIN/COMMIT."""
+    with pooled_connection(conn) as conn:
+        # Внутри чужой открытой транзакции режим не трогаем — читаем в ней
+        idle = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        autocommit = conn.autocommit
+        if idle:
+            conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                yield cur
+        finally:
+            if idle:
+                conn.autocommit = autocommit
+
+
 def init_db():
     """Создать все таблицы из schema.sql."""
     schema_path = os.path.join(os.path.dirname(__file__), "schema.sql")
     with open(schema_path, "r", encoding="utf-8") as f:
         sql = f.read()
-    conn = get_connection()
+    conn = _pool().getconn()
     try:
         with conn.cursor() as cur:
             cur.execute(sql)
         conn.commit()
         print("[DB] Schema OK")
     finally:
-        conn.close()
+        _pool().putconn(conn)
+
+
+# ───────────────────────────────────────────────
+# COPY-хелперы
+# ───────────────────────────────────────────────
+
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+_PG_NULL = struct.pack("!i", -1)
+_PG_EPOCH = datetime.date(2000, 1, 1).toordinal()
+_TEXT_OID = 25
+
+
+def _encode_text_array(values) -> bytes:
+    if not values:
+        return struct.pack("!iii", 0, 0, _TEXT_OID)
+    parts = [struct.pack("!iiiii", 1, 0, _TEXT_OID, len(values), 1)]
+    for v in values:
+        b = v.encode()
+        parts.append(struct.pack("!i", len(b)) + b)
+    return b"".join(parts)
+
+
+# Бинарные форматы типов Postgres (то, что ждёт COPY ... FORMAT BINARY)
+_BINARY_ENCODERS = {
+    "int2":   lambda v: struct.pack("!h", v),
+    "int4":   lambda v: struct.pack("!i", v),
+    "float8": lambda v: struct.pack("!d", v),
+    "bool":   lambda v: b"\x01" if v else b"\x00",
+    "text":   lambda v: v.encode(),
+    "bytea":  bytes,
+    "jsonb":  lambda v: b"\x01" + v.encode(),
+    "date":   lambda v: struct.pack("!i", v.toordinal() - _PG_EPOCH),
+    "text[]": _encode_text_array,
+}
+
+
+def _copy_rows(cur, table: str, columns, rows):
+    """
+    Заливает строки в таблицу одним COPY ... FROM STDIN (FORMAT BINARY):
+    сервер не парсит текст/CSV, значения уходят в родном формате типа.
+    columns — пары (колонка, тип); None → NULL.
+    """
+    encoders = [_BINARY_ENCODERS[t] for _, t in columns]
+    field_count = struct.pack("!h", len(columns))
+    parts = [_PGCOPY_HEADER]
+    for row in rows:
+        parts.append(field_count)
+        for encode, value in zip(encoders, row):
+            if value is None:
+                parts.append(_PG_NULL)
+            else:
+                data = encode(value)
+                parts.append(struct.pack("!i", len(data)))
+                parts.append(data)
+    parts.append(_PGCOPY_TRAILER)
+    names = ", ".join(name for name, _ in columns)
+    cur.copy_expert(
+        f"COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)",
+        io.BytesIO(b"".join(parts)),
+    )
+
+
+def _copy_via_stage(cur, table: str, columns, rows, on_conflict: str, returning: str = None):
+    """
+    COPY во временную таблицу (не пишет WAL, удаляется при COMMIT),
+    затем один INSERT ... SELECT в основную таблицу с ON CONFLICT.
+    С returning возвращает строки RETURNING (fetchall).
+    """
+    stage = f"{table}_stage"
+    cols = ", ".join(name for name, _ in columns)
+    cur.execute(
+        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+        f"SELECT {cols} FROM {table} WITH NO DATA"
+    )
+    _copy_rows(cur, stage, columns, rows)
+    cur.execute(
+        f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} "
+        f"ON CONFLICT {on_conflict}"
+        + (f" RETURNING {returning}" if returning else "")
+    )
+    return cur.fetchall() if returning else None
 
 
 # ───────────────────────────────────────────────
 # ЗАГРУЗКА CSV → БД
 # ───────────────────────────────────────────────
 
+_TICKET_COLUMNS = {
+    "guid клиента", "пол клиента", "дата рождения", "описание", "вложения",
+    "сегмент клиента", "страна", "область", "населенный пункт", "улица", "дом",
+}
+_MANAGER_COLUMNS = {
+    "фио", "должность", "офис", "навыки", "количество обращений в работе",
+}
+_UNIT_COLUMNS = {"офис", "адрес"}
+
+
+def _normalize_column(name: str) -> str:
+    return name.strip().lower().replace("ё", "е")
+
+
+def _read_csv(path: str, columns: set) -> pd.DataFrame:
+    """
+    Читает только нужные колонки и сразу как строки: без вывода типов
+    и без подстановки NaN (пустая ячейка → "").
+    """
+    if PYARROW_AVAILABLE:
+        # Многопоточный парсер pyarrow не принимает usecols-функцию —
+        # отбираем колонки по заголовку
+        header = pd.read_csv(path, encoding="utf-8-sig", nrows=0).columns
+        df = pd.read_csv(
+            path,
+            engine="pyarrow",
+            encoding="utf-8-sig",
+            dtype=str,
+            keep_default_na=False,
+            usecols=[c for c in header if _normalize_column(c) in columns],
+        )
+    else:
+        df = pd.read_csv(
+            path,
+            encoding="utf-8-sig",
+            dtype=str,
+            keep_default_na=False,
+            usecols=lambda c: _normalize_column(c) in columns,
+        )
+    df.columns = df.columns.map(_normalize_column)
+    return df
+
+
 def load_csv(
     tickets_path  = "tickets.csv",
     managers_path = "managers.csv",
@@ -90,97 +299,140 @@ def load_csv(
     from ai.geo import GeoNormalizer
     geo = GeoNormalizer()
 
-    tickets_df  = pd.read_csv(tickets_path,  encoding="utf-8-sig")
-    managers_df = pd.read_csv(managers_path, encoding="utf-8-sig")
-    units_df    = pd.read_csv(units_path,    encoding="utf-8-sig")
+    tickets_df  = _read_csv(tickets_path,  _TICKET_COLUMNS)
+    managers_df = _read_csv(managers_path, _MANAGER_COLUMNS)
+    units_df    = _read_csv(units_path,    _UNIT_COLUMNS)
 
-    tickets_df.columns  = tickets_df.columns.str.strip().str.lower().str.replace("ё", "е")
-    managers_df.columns = managers_df.columns.str.strip().str.lower().str.replace("ё", "е")
-    units_df.columns    = units_df.columns.str.strip().str.lower().str.replace("ё", "е")
-
-    conn = get_connection()
+    conn = _pool().getconn()
     try:
         with conn.cursor() as cur:
+            # Импорт — одна транзакция; ждать fsync WAL на COMMIT не нужно:
+            # при сбое импорт просто запускается заново
+            cur.execute("SET LOCAL synchronous_commit = off")
+            cur.execute("SET LOCAL work_mem = '256MB'")
 
             # --- Офисы ---
-            office_map = {}
-            for _, row in units_df.iterrows():
-                name        = str(row.get("офис", "")).strip()
-                csv_address = str(row.get("адрес", "") or "").strip()
-
+            # Одно имя в CSV дважды → побеждает последняя строка (как раньше
+            # с построчным upsert); дубли в одном INSERT Postgres не пропустит
+            units_df = units_df.reindex(columns=list(_UNIT_COLUMNS), fill_value="")
+            offices = {}
+            for name, csv_address in zip(units_df["офис"].str.strip(), units_df["адрес"].str.strip()):
                 # Адрес: из CSV если есть, иначе из справочника
                 address = _resolve_address(name, csv_address)
-
                 lat, lon = geo.geocode(name)
-                cur.execute("""
-                    INSERT INTO offices (name, address, lat, lon)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (name) DO UPDATE
+                offices[name] = (name, address, lat, lon)
+
+            office_map = dict(_copy_via_stage(
+                cur, "offices",
+                (("name", "text"), ("address", "text"),
+                 ("lat", "float8"), ("lon", "float8")),
+                list(offices.values()),
+                on_conflict="""(name) DO UPDATE
                         SET address = EXCLUDED.address,
                             lat     = EXCLUDED.lat,
-                            lon     = EXCLUDED.lon
-                    RETURNING id
-                """, (name, address, lat, lon))
-                office_map[name] = cur.fetchone()[0]
+                            lon     = EXCLUDED.lon""",
+                returning="name, id",
+            ))
             print(f"[DB] Offices loaded: {len(office_map)}")
 
             # --- Менеджеры ---
-            for _, row in managers_df.iterrows():
-                name     = str(row.get("фио", "")).strip()
-                position = str(row.get("должность", "")).strip()
-                office_n = str(row.get("офис", "")).strip()
-                skills_s = str(row.get("навыки", "")).strip()
-                load_val = int(row.get("количество обращений в работе", 0) or 0)
-                skills   = [s.strip() for s in skills_s.replace(";", ",").split(",") if s.strip()]
-                office_id = office_map.get(office_n)
-                cur.execute("""
-                    INSERT INTO managers (name, position, office_id, skills, load)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (name) DO NOTHING
-                """, (name, position, office_id, skills, load_val))
+            managers_df = managers_df.reindex(columns=list(_MANAGER_COLUMNS), fill_value="")
+            skills = (
+                managers_df["навыки"]
+                .str.replace(";", ",", regex=False)
+                .str.split(",")
+                .map(lambda xs: [s for s in (t.strip() for t in xs) if s])
+            )
+            loads = (
+                pd.to_numeric(managers_df["количество обращений в работе"], errors="coerce")
+                .fillna(0).astype(int)
+            )
+            office_ids = [office_map.get(o.strip()) for o in managers_df["офис"]]
+
+            rows = list(zip(
+                managers_df["фио"].str.strip(),
+                managers_df["должность"].str.strip(),
+                office_ids,
+                skills,
+                loads.tolist(),
+            ))
+            _copy_via_stage(
+                cur, "managers",
+                (("name", "text"), ("position", "text"), ("office_id", "int4"),
+                 ("skills", "text[]"), ("load", "int4")),
+                rows,
+                on_conflict="(name) DO NOTHING",
+            )
             print(f"[DB] Managers loaded: {len(managers_df)}")
 
             # --- Тикеты ---
-            count = 0
-            for _, row in tickets_df.iterrows():
-                guid = str(row.get("guid клиента", "")).strip()
-                if not guid:
-                    continue
-
-                bd = row.get("дата рождения", None)
-                birth_date = None
-                if pd.notna(bd):
-                    try:
-                        birth_date = pd.to_datetime(bd).date()
-                    except Exception:
-                        pass
-
-                cur.execute("""
-                    INSERT INTO tickets
-                        (guid, gender, birth_date, description, attachment,
-                         segment, country, region, city, street, house)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                    ON CONFLICT (guid) DO NOTHING
-                """, (
-                    guid,
-                    str(row.get("пол клиента", "") or ""),
-                    birth_date,
-                    str(row.get("описание", "") or ""),
-                    str(row.get("вложения", "") or ""),
-                    str(row.get("сегмент клиента", "") or ""),
-                    str(row.get("страна", "") or ""),
-                    str(row.get("область", "") or ""),
-                    str(row.get("населенный пункт", "") or ""),
-                    str(row.get("улица", "") or ""),
-                    str(row.get("дом", "") or ""),
-                ))
-                count += 1
-            print(f"[DB] Tickets loaded: {count}")
+            tickets_df = tickets_df.reindex(columns=list(_TICKET_COLUMNS), fill_value="")
+            tickets_df["guid клиента"] = tickets_df["guid клиента"].str.strip()
+            tickets_df = tickets_df[tickets_df["guid клиента"] != ""]
+            # Даты рождения — один проход по колонке; мусор → NaT → NULL
+            parsed = pd.to_datetime(tickets_df["дата рождения"], errors="coerce", format="mixed")
+            birth_dates = parsed.dt.date.astype(object).where(parsed.notna(), None).tolist()
+
+            rows = list(zip(
+                tickets_df["guid клиента"],
+                tickets_df["пол клиента"],
+                birth_dates,
+                tickets_df["описание"],
+                tickets_df["вложения"],
+                tickets_df["сегмент клиента"],
+                tickets_df["страна"],
+                tickets_df["область"],
+                tickets_df["населенный пункт"],
+                tickets_df["улица"],
+                tickets_df["дом"],
+            ))
+            _copy_via_stage(
+                cur, "tickets",
+                (("guid", "text"), ("gender", "text"), ("birth_date", "date"),
+                 ("description", "text"), ("attachment", "text"), ("segment", "text"),
+                 ("country", "text"), ("region", "text"), ("city", "text"),
+                 ("street", "text"), ("house", "text")),
+                rows,
+                on_conflict="(guid) DO NOTHING",
+            )
+            print(f"[DB] Tickets loaded: {len(rows)}")
 
         conn.commit()
         print("[DB] CSV import done ✅")
     finally:
-        conn.close()
+        _pool().putconn(conn)
+
+
+# ───────────────────────────────────────────────
+# Кеш AI-обогащения
+# ───────────────────────────────────────────────
+
+def get_ai_cache(keys, conn=None) -> dict:
+    """Один SELECT на все ключи → {hash: payload} для найденных."""
+    keys = [psycopg2.Binary(k) for k in set(keys)]
+    if not keys:
+        return {}
+    with _read_only(conn) as cur:
+        cur.execute("SELECT hash, payload FROM ai_cache WHERE hash = ANY(%s)", (keys,))
+        rows = cur.fetchall()
+    return {bytes(h): payload for h, payload in rows}
+
+
+def save_ai_cache(entries: dict, conn=None):
+    """Записывает {hash: payload} одним COPY; существующие ключи перезаписываются."""
+    if not entries:
+        return
+    with pooled_connection(conn) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL synchronous_commit = off")
+            _copy_via_stage(
+                cur, "ai_cache",
+                (("hash", "bytea"), ("payload", "jsonb")),
+                [(h, _json_dumps(payload)) for h, payload in entries.items()],
+                on_conflict="(hash) DO UPDATE SET payload = EXCLUDED.payload",
+            )
+        conn.commit()
+    print(f"[DB] AI cache: сохранено {len(entries)}")
 
 
 # ───────────────────────────────────────────────
@@ -192,27 +444,29 @@ def patch_office_addresses():
     Обновляет адреса офисов в БД из встроенного справочника.
     Запускать если офисы уже загружены, но адреса пустые.
     """
-    conn = get_connection()
-    updated = 0
+    conn = _pool().getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, name, address FROM offices")
-            offices = cur.fetchall()
-            for oid, name, current_addr in offices:
-                if current_addr and current_addr.strip() not in ("", "nan", "none"):
-                    continue  # адрес уже есть — не трогаем
-                new_addr = _resolve_address(name, "")
-                if new_addr:
-                    cur.execute(
-                        "UPDATE offices SET address = %s WHERE id = %s",
-                        (new_addr, oid)
-                    )
-                    updated += 1
-                    print(f"[DB] Address patched: {name} → {new_addr}")
+            # Один UPDATE на все офисы: ключ справочника считается на стороне БД
+            # той же нормализацией, что и _normalize_office_key()
+            patched = psycopg2.extras.execute_values(cur, r"""
+                UPDATE offices AS o
+                   SET address = m.new_addr
+                  FROM (VALUES %s) AS m(key, new_addr)
+                 WHERE replace(
+                           regexp_replace(lower(trim(o.name)), '^(г\.|город |city )\s*', ''),
+                           'ё', 'е'
+                       ) = m.key
+                   AND COALESCE(trim(o.address), '') IN ('', 'nan', 'none')
+             RETURNING o.name, m.new_addr
+            """, list(_NORMALIZED_OFFICE_ADDRESSES.items()), fetch=True)
+            for name, new_addr in patched:
+                print(f"[DB] Address patched: {name} → {new_addr}")
         conn.commit()
+        updated = len(patched)
         print(f"[DB] Patched {updated} office addresses ✅")
     finally:
-        conn.close()
+        _pool().putconn(conn)
     return updated
 
 
@@ -220,128 +474,222 @@ def patch_office_addresses():
 # ЧТЕНИЕ ИЗ БД → DataFrame
 # ───────────────────────────────────────────────
 
-def get_tickets_df() -> pd.DataFrame:
-    conn = get_connection()
-    try:
-        return pd.read_sql("""
-            SELECT guid, description, segment, country,
-                   city, gender, birth_date, region, street, house
-            FROM tickets
-        """, conn)
-    finally:
-        conn.close()
+_TICKETS_SQL = """
+    SELECT guid, description, segment, country,
+           city, gender, birth_date, region, street, house
+    FROM tickets
+"""
 
+_MANAGERS_SQL = """
+    SELECT
+        m.name      AS "ФИО",
+        m.position  AS "Должность ",
+        o.name      AS "Офис",
+        array_to_string(m.skills, ', ') AS "Навыки",
+        m.load      AS "Количество обращений в работе"
+    FROM managers m
+    LEFT JOIN offices o ON o.id = m.office_id
+"""
 
-def get_managers_df() -> pd.DataFrame:
-    conn = get_connection()
-    try:
-        return pd.read_sql("""
-            SELECT
-                m.name      AS "ФИО",
-                m.position  AS "Должность ",
-                o.name      AS "Офис",
-                array_to_string(m.skills, ', ') AS "Навыки",
-                m.load      AS "Количество обращений в работе"
-            FROM managers m
-            LEFT JOIN offices o ON o.id = m.office_id
-        """, conn)
-    finally:
-        conn.close()
+_OFFICES_SQL = 'SELECT name AS "Офис", address AS "Адрес" FROM offices'
 
 
-def get_offices_df() -> pd.DataFrame:
-    conn = get_connection()
-    try:
-        return pd.read_sql(
-            "SELECT name AS \"Офис\", address AS \"Адрес\" FROM offices",
-            conn
-        )
-    finally:
-        conn.close()
+def _read_copy(cur, sql: str) -> pd.DataFrame:
+    """
+    SELECT через COPY ... TO STDOUT (CSV) → DataFrame: данные идут одним
+    потоком и парсятся в C, без построчных Python-кортежей курсора.
+    Все колонки — строки; NULL → None (как у read_sql), пустая строка → "".
+    """
+    buf = io.BytesIO()
+    cur.copy_expert(
+        f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '\\N')", buf
+    )
+    buf.seek(0)
+    df = pd.read_csv(buf, dtype=str, keep_default_na=False, na_values=[r"\N"])
+    return df.astype(object).where(df.notna(), None)
+
+
+def _managers_frame(cur) -> pd.DataFrame:
+    df = _read_copy(cur, _MANAGERS_SQL)
+    load = "Количество обращений в работе"
+    df[load] = pd.to_numeric(df[load])
+    return df
+
+
+def get_reference_dfs(conn=None):
+    """Менеджеры и офисы — на одном соединении: (managers, offices)."""
+    with _read_only(conn) as cur:
+        return _managers_frame(cur), _read_copy(cur, _OFFICES_SQL)
+
+
+def get_tickets_df(conn=None) -> pd.DataFrame:
+    with _read_only(conn) as cur:
+        return _read_copy(cur, _TICKETS_SQL)
+
+
+def get_managers_df(conn=None) -> pd.DataFrame:
+    with _read_only(conn) as cur:
+        return _managers_frame(cur)
+
+
+def get_offices_df(conn=None) -> pd.DataFrame:
+    with _read_only(conn) as cur:
+        return _read_copy(cur, _OFFICES_SQL)
 
 
 # ───────────────────────────────────────────────
 # СОХРАНЕНИЕ РЕЗУЛЬТАТОВ → БД
 # ───────────────────────────────────────────────
 
-def save_results(result_df: pd.DataFrame):
-    conn = get_connection()
-    saved = 0
-    try:
-        with conn.cursor() as cur:
+def _json_default(obj):
+    """numpy-скаляры и массивы → обычные Python-значения (для json без orjson)."""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(obj) -> str:
+    # trace из движка (trace_format="dict") может содержать numpy-значения —
+    # та же опция, что и в engine._trace_json
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj, ensure_ascii=False, default=_json_default)
+
+
+def _json_loads(s: str):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(s)
+    return json.loads(s)
+
 
-            cur.execute("SELECT name, id FROM offices")
-            office_map = {row[0]: row[1] for row in cur.fetchall()}
+def _str_column(df: pd.DataFrame, column: str) -> list:
+    """Колонка → список str; отсутствующие значения → ""."""
+    if column not in df.columns:
+        return [""] * len(df)
+    return df[column].astype("string").fillna("").tolist()
 
-            cur.execute("SELECT name, id FROM managers")
-            manager_map = {row[0]: row[1] for row in cur.fetchall()}
 
+def _int_column(df: pd.DataFrame, column: str, default: int) -> list:
+    """Колонка → список int; пустые и нечисловые значения → default."""
+    if column not in df.columns:
+        return [default] * len(df)
+    return pd.to_numeric(df[column], errors="coerce").fillna(default).astype(int).tolist()
+
+
+def _nullable_float_column(df: pd.DataFrame, column: str) -> list:
+    """Колонка → список float; NaN и пустые значения → None (NULL в БД)."""
+    if column not in df.columns:
+        return [None] * len(df)
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(np.float64)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _map_ids(keys: pd.Series, id_map: dict) -> list:
+    """Имена → id через Series.map; ненайденные → None (NULL в БД)."""
+    ids = keys.map(id_map).astype("Int64")
+    return ids.astype(object).where(ids.notna(), None).tolist()
+
+
+def _trace_json(trace) -> str:
+    """trace из движка (JSON-строка или dict) → JSON для колонки JSONB."""
+    if isinstance(trace, str):
+        try:
+            trace = _json_loads(trace)
+        except Exception:
+            trace = {}
+    return _json_dumps(trace)
+
+
+def save_results(result_df: pd.DataFrame, conn=None):
+    saved = 0
+    with pooled_connection(conn) as conn:
+        with conn.cursor() as cur:
+
+            # Чистка прошлых результатов и все справочники id — одним запросом
+            # (psycopg2 отправляет несколько statement'ов за один round-trip)
             guids = result_df["guid"].astype(str).tolist()
+            cur.execute("""
+                DELETE FROM assignments
+                 WHERE ticket_id IN (SELECT id FROM tickets WHERE guid = ANY(%(guids)s));
+                DELETE FROM ai_analysis
+                 WHERE ticket_id IN (SELECT id FROM tickets WHERE guid = ANY(%(guids)s));
+                SELECT 'office',  name, id FROM offices
+                UNION ALL
+                SELECT 'manager', name, id FROM managers
+                UNION ALL
+                SELECT 'ticket',  guid, id FROM tickets WHERE guid = ANY(%(guids)s);
+            """, {"guids": guids})
+            id_maps = {"office": {}, "manager": {}, "ticket": {}}
+            for kind, key, id_ in cur.fetchall():
+                id_maps[kind][key] = id_
+            office_map    = id_maps["office"]
+            manager_map   = id_maps["manager"]
+            ticket_id_map = id_maps["ticket"]
+            if ticket_id_map:
+                print(f"[DB] Cleared previous results for {len(ticket_id_map)} tickets")
+
+            known = result_df["guid"].astype(str).isin(ticket_id_map.keys()).to_numpy()
+            for guid in result_df.loc[~known, "guid"]:
+                print(f"[DB] WARN: ticket not found guid={guid}")
+            found = result_df[known]
+
+            # id для ai_analysis выделяем заранее — тогда обе таблицы
+            # можно залить через COPY независимо друг от друга
             cur.execute(
-                "SELECT guid, id FROM tickets WHERE guid = ANY(%s)",
-                (guids,)
+                "SELECT nextval('ai_analysis_id_seq') FROM generate_series(1, %s)",
+                (len(found),)
             )
-            ticket_id_map = {row[0]: row[1] for row in cur.fetchall()}
-
-            ticket_ids = list(ticket_id_map.values())
-            if ticket_ids:
-                cur.execute("DELETE FROM assignments WHERE ticket_id = ANY(%s)", (ticket_ids,))
-                cur.execute("DELETE FROM ai_analysis  WHERE ticket_id = ANY(%s)", (ticket_ids,))
-                print(f"[DB] Cleared previous results for {len(ticket_ids)} tickets")
-
-            for _, row in result_df.iterrows():
-                guid = str(row["guid"])
-                ticket_id = ticket_id_map.get(guid)
-                if not ticket_id:
-                    print(f"[DB] WARN: ticket not found guid={guid}")
-                    continue
-
-                cur.execute("""
-                    INSERT INTO ai_analysis
-                        (ticket_id, ai_type, ai_lang, sentiment,
-                         priority, summary, recommendation, lat, lon)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                    RETURNING id
-                """, (
-                    ticket_id,
-                    str(row.get("ai_type", "")),
-                    str(row.get("ai_lang", "")),
-                    str(row.get("sentiment", "")),
-                    int(row.get("priority", 5)),
-                    str(row.get("summary", "")),
-                    str(row.get("recommendation", "")),
-                    row.get("lat") or None,
-                    row.get("lon") or None,
-                ))
-                ai_id = cur.fetchone()[0]
-
-                manager_name  = str(row.get("manager", ""))
-                is_escalation = manager_name == "CAPITAL_ESCALATION"
-                manager_id    = manager_map.get(manager_name) if not is_escalation else None
-                office_id     = office_map.get(str(row.get("office", "")))
-
-                trace = row.get("trace", "{}")
-                if isinstance(trace, str):
-                    try:
-                        trace = json.loads(trace)
-                    except Exception:
-                        trace = {}
-
-                cur.execute("""
-                    INSERT INTO assignments
-                        (ticket_id, ai_analysis_id, manager_id, office_id,
-                         office_reason, distance_km, is_escalation, trace)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-                """, (
-                    ticket_id, ai_id, manager_id, office_id,
-                    str(row.get("office_reason", "")),
-                    row.get("distance_km") or None,
-                    is_escalation,
-                    json.dumps(trace, ensure_ascii=False),
-                ))
-                saved += 1
+            ai_ids = [r[0] for r in cur.fetchall()]
+
+            # Все колонки приводятся один раз целиком, строки собираются zip'ом
+            text = {
+                c: _str_column(found, c)
+                for c in ("ai_type", "ai_lang", "sentiment", "summary",
+                          "recommendation", "office_reason")
+            }
+            priority      = _int_column(found, "priority", default=5)
+            lat           = _nullable_float_column(found, "lat")
+            lon           = _nullable_float_column(found, "lon")
+            distance_km   = _nullable_float_column(found, "distance_km")
+            escalation    = found["manager"].astype(str).eq("CAPITAL_ESCALATION").to_numpy()
+            is_escalation = escalation.tolist()
+
+            ticket_ids  = _map_ids(found["guid"].astype(str), ticket_id_map)
+            manager_ids = np.where(
+                escalation, None, _map_ids(found["manager"].astype(str), manager_map)
+            ).tolist()
+            office_ids  = _map_ids(found["office"].astype(str), office_map)
+            traces      = [_trace_json(t) for t in found.get("trace", ["{}"] * len(found))]
+
+            ai_rows = list(zip(
+                ai_ids, ticket_ids,
+                text["ai_type"], text["ai_lang"], text["sentiment"],
+                priority,
+                text["summary"], text["recommendation"],
+                lat, lon,
+            ))
+            asg_rows = list(zip(
+                ticket_ids, ai_ids, manager_ids, office_ids,
+                text["office_reason"], distance_km, is_escalation, traces,
+            ))
+
+            _copy_rows(
+                cur, "ai_analysis",
+                (("id", "int4"), ("ticket_id", "int4"), ("ai_type", "text"),
+                 ("ai_lang", "text"), ("sentiment", "text"), ("priority", "int2"),
+                 ("summary", "text"), ("recommendation", "text"),
+                 ("lat", "float8"), ("lon", "float8")),
+                ai_rows,
+            )
+            _copy_rows(
+                cur, "assignments",
+                (("ticket_id", "int4"), ("ai_analysis_id", "int4"),
+                 ("manager_id", "int4"), ("office_id", "int4"),
+                 ("office_reason", "text"), ("distance_km", "float8"),
+                 ("is_escalation", "bool"), ("trace", "jsonb")),
+                asg_rows,
+            )
+            saved = len(asg_rows)
 
         conn.commit()
-        print(f"[DB] Assignments saved: {saved} ✅")
-    finally:
-        conn.close()
\ No newline at end of file
+        print(f"[DB] Assignments saved: {saved} ✅")
\ No newline at end of file
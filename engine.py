@@ -16,11 +16,22 @@ import re
 import time
 from typing import Dict, List, Tuple, Any, Optional
 
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 from ai.geo import GeoNormalizer
 
 
+# Routing-relevant skills as bits of managers' skills_bits
+_SKILL_BITS = {"VIP": 1, "KZ": 2, "ENG": 4}
+
+
 _CHIEF_POSITION_PATTERNS = (
     "глав",
     "chief",
@@ -29,8 +40,19 @@ _CHIEF_POSITION_PATTERNS = (
 )
 
 
+# "startswith or contains" for every pattern is just "contains any"
+_CHIEF_RE = re.compile("|".join(map(re.escape, _CHIEF_POSITION_PATTERNS)))
+
+
 def _is_chief(pos_norm: str) -> bool:
-    return any(pos_norm.startswith(p) or p in pos_norm for p in _CHIEF_POSITION_PATTERNS)
+    return _CHIEF_RE.search(pos_norm) is not None
+
+
+def _trace_json(trace: Dict[str, Any]) -> str:
+    if ORJSON_AVAILABLE:
+        # numpy scalars (loads, distances) serialize without a Python round-trip
+        return orjson.dumps(trace, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(trace, ensure_ascii=False)
 
 
 def _clean_city(raw: str) -> str:
@@ -62,30 +84,49 @@ class FIREEngine:
         units_df: pd.DataFrame,
     ):
         self.geo = GeoNormalizer()
+        # Memoized geo lookups — the same cities repeat across a batch
+        self._norm_cache: Dict[str, str] = {}
+        self._geocode_cache: Dict[Tuple[str, str], Tuple[Optional[float], Optional[float]]] = {}
+        self._by_distance_cache: Dict[Tuple[float, float], List[Tuple[str, float]]] = {}
+        self._nearest_cache: Dict[Tuple[float, float], Tuple[str, float]] = {}
+        self._filter_pass_cache: Dict[Tuple[str, str, str], list] = {}
 
         self.tickets = self._prepare_tickets(tickets_df)
         self.managers = self._prepare_managers(managers_df)
         self.units = self._prepare_units(units_df)
 
+        # Normalized office names for substring matching (empty ones never match)
+        self._units_norm: List[Tuple[str, str]] = [
+            (off, norm) for off in self.units["office"].tolist()
+            if (norm := self._norm(off))
+        ]
+
         self.astana_office = self._find_office("астан")
         self.almaty_office = self._find_office("алмат")
 
-        self.rr_counters: Dict[Tuple[str, str], int] = {}
+        self._build_buckets()
+
+        # RR counters per (office bucket id, language id); new languages add columns
+        self._lang_ids: Dict[str, int] = {"KZ": 0, "ENG": 1, "RU": 2}
+        self._rr = np.zeros((len(self._office_buckets) + 1, 4), dtype=np.int64)
         self.unknown_loc_counter = 0
 
         # Cache office coords
         self._office_coords: Dict[str, Tuple[float, float]] = {}
         for off in self.units["office"].tolist():
-            lat, lon = self.geo.geocode(off)
+            lat, lon = self._geocode(off)
             if lat is not None:
                 self._office_coords[off] = (lat, lon)
+        self._office_names = np.array(list(self._office_coords), dtype=object)
+        self._office_lat = np.array([c[0] for c in self._office_coords.values()], dtype=float)
+        self._office_lon = np.array([c[1] for c in self._office_coords.values()], dtype=float)
 
     # ──────────────────────────────────────────────────────────────────────────
     # PREPARE
     # ──────────────────────────────────────────────────────────────────────────
 
     def _prepare_tickets(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
+        df = df.copy(deep=False)  # only the header changes here; rename() below copies the data
         df.columns = df.columns.str.strip().str.lower().str.replace("ё", "е")
 
         rename_map = {
@@ -108,6 +149,17 @@ class FIREEngine:
         df["region"] = df.get("region", pd.Series([""] * len(df))).fillna("").astype(str)
         df["country"] = df["country"].fillna("").astype(str)
 
+        # Country/city classification for get_office, once per column
+        country_lc = df["country"].str.lower().str.strip()
+        df["is_kz"] = country_lc.str.contains("kaz|каз", regex=True).to_numpy(bool)
+        df["is_unknown_country"] = country_lc.isin(["", "nan", "none"]).to_numpy(bool)
+        df["city_norm"] = df["city"].str.strip().map(self._norm)
+
+        # Low-cardinality routing keys → categoricals (int-coded compares)
+        for col in ("segment", "ai_type", "ai_lang"):
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+
         if "lat" in df.columns:
             df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
         if "lon" in df.columns:
@@ -116,7 +168,7 @@ class FIREEngine:
         return df
 
     def _prepare_managers(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
+        df = df.copy(deep=False)  # only the header changes here; rename() below copies the data
         df.columns = df.columns.str.strip().str.lower().str.replace("ё", "е")
 
         rename_map = {
@@ -137,19 +189,84 @@ class FIREEngine:
 
         df["load"] = pd.to_numeric(df["load"], errors="coerce").fillna(0).astype(int)
         df["name"] = df["name"].astype(str).str.strip()
-        df["office"] = df["office"].astype(str).str.strip()
-        df["pos_norm"] = (
-            df["position"].astype(str).str.lower()
-            .str.replace("ё", "е")
-            .str.replace("специалист", "спец")
-            .str.strip()
+        df["office"] = df["office"].astype(str).str.strip().astype("category")
+        # Positions repeat a lot — normalise each distinct one in a single pass
+        position = df["position"].astype(str)
+        df["pos_norm"] = position.map({
+            p: p.lower().replace("ё", "е").replace("специалист", "спец").strip()
+            for p in position.unique()
+        })
+        df["is_chief"] = df["pos_norm"].str.contains(_CHIEF_RE, na=False).to_numpy(bool)
+
+        skills = (
+            df["skills"].where(df["skills"].notna(), "").astype(str)
+            .str.replace(";", ",", regex=False).str.upper()
         )
-        df["is_chief"] = df["pos_norm"].apply(_is_chief)
-        df["skills_set"] = df["skills"].apply(self._parse_skills)
+        # Skill bitmask straight from the normalised string — one C-level scan per skill
+        bits = np.zeros(len(df), dtype=np.uint32)
+        for skill, bit in _SKILL_BITS.items():
+            has_skill = skills.str.contains(rf"(?:^|,)\s*{skill}\s*(?:,|$)", regex=True)
+            bits |= np.where(has_skill.to_numpy(bool), bit, 0).astype(np.uint32)
+        df["skills_bits"] = bits
         return df
 
+    def _build_buckets(self) -> None:
+        """
+        Group managers by office into flat numpy arrays, one bucket per office.
+        All buckets share self._loads: each bucket's "load" is a slice view of
+        it, so assigning a ticket is a single int increment.
+        """
+        m = self.managers
+        codes = m["office"].cat.codes.to_numpy()
+        offices = m["office"].cat.categories
+        # Order by office, then name: within a bucket position == name order,
+        # so selection never compares strings
+        by_name = np.argsort(m["name"].to_numpy(object), kind="stable")
+        name_rank = np.empty(len(m), dtype=np.int64)
+        name_rank[by_name] = np.arange(len(m))
+        order = np.lexsort((name_rank, codes))
+        bounds = np.searchsorted(codes[order], np.arange(len(offices) + 1))
+
+        self._assigned: List[int] = []
+        self._loads = m["load"].to_numpy(np.int64)[order]
+        names = m["name"].to_numpy(object)[order]
+        is_chief = m["is_chief"].to_numpy(bool)[order]
+        skills_bits = m["skills_bits"].to_numpy(np.uint32)[order]
+
+        def bucket(sl: slice) -> Dict[str, np.ndarray]:
+            b = {"name": names[sl], "load": self._loads[sl], "rows": order[sl]}
+            # Candidate positions (name order) for every filter combination:
+            # (needs_vip, needs_chief, lang) with lang in (None, "KZ", "ENG")
+            b["combos"] = {}
+            for vip in (False, True):
+                for chief in (False, True):
+                    for lang in (None, "KZ", "ENG"):
+                        required = (_SKILL_BITS["VIP"] if vip else 0) | _SKILL_BITS.get(lang, 0)
+                        mask = (skills_bits[sl] & required) == required
+                        if chief:
+                            mask &= is_chief[sl]
+                        b["combos"][(vip, chief, lang)] = np.flatnonzero(mask)
+            return b
+
+        self._office_buckets: Dict[str, Dict[str, np.ndarray]] = {}
+        for k, office in enumerate(offices):
+            self._office_buckets[office] = bucket(slice(bounds[k], bounds[k + 1]))
+            self._office_buckets[office]["id"] = k
+        self._empty_bucket = bucket(slice(0, 0))
+        self._empty_bucket["id"] = len(offices)
+
+    def _bucket(self, office: str) -> Dict[str, np.ndarray]:
+        return self._office_buckets.get(office, self._empty_bucket)
+
+    def _sync_loads(self) -> None:
+        """Apply this batch's assignments to self.managers["load"] in one pass."""
+        loads = self.managers["load"].to_numpy(np.int64, copy=True)
+        np.add.at(loads, np.asarray(self._assigned, dtype=np.int64), 1)
+        self.managers["load"] = loads
+        self._assigned.clear()
+
     def _prepare_units(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
+        df = df.copy(deep=False)  # only the header changes here; rename() below copies the data
         df.columns = df.columns.str.strip().str.lower().str.replace("ё", "е")
         rename_map = {"офис": "office", "бизнес-единица": "office", "unit": "office"}
         df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
@@ -158,12 +275,6 @@ class FIREEngine:
         df["office"] = df["office"].astype(str).str.strip()
         return df
 
-    @staticmethod
-    def _parse_skills(value: Any) -> set:
-        if pd.isna(value):
-            return set()
-        return {s.strip().upper() for s in str(value).replace(";", ",").split(",") if s.strip()}
-
     # ──────────────────────────────────────────────────────────────────────────
     # OFFICE LOGIC
     # ──────────────────────────────────────────────────────────────────────────
@@ -173,66 +284,150 @@ class FIREEngine:
         found = self.units.loc[mask, "office"].values
         return found[0] if len(found) else pattern.capitalize()
 
+    def _office_distances(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Haversine km from each (lat, lon) to every office → (N, M) matrix."""
+        lat = np.asarray(lat, dtype=float)[:, None]
+        lon = np.asarray(lon, dtype=float)[:, None]
+        dlat = np.radians(self._office_lat[None, :] - lat)
+        dlon = np.radians(self._office_lon[None, :] - lon)
+        a = (np.sin(dlat / 2.0) ** 2
+             + np.cos(np.radians(lat)) * np.cos(np.radians(self._office_lat[None, :]))
+             * np.sin(dlon / 2.0) ** 2)
+        return 2.0 * 6371.0 * np.arcsin(np.sqrt(a))
+
+    def _nearest_office_vec(
+        self, lat: np.ndarray, lon: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest office for a batch of coords → (office index, distance_km)."""
+        d = self._office_distances(lat, lon)
+        idx = d.argmin(axis=1)
+        return idx, d[np.arange(len(idx)), idx]
+
+    def _norm(self, text: str) -> str:
+        norm = self._norm_cache.get(text)
+        if norm is None:
+            norm = self._norm_cache[text] = self.geo.normalise(text)
+        return norm
+
+    def _geocode(
+        self, city: str, region: str = ""
+    ) -> Tuple[Optional[float], Optional[float]]:
+        key = (city, region)
+        coords = self._geocode_cache.get(key)
+        if coords is None:
+            coords = self._geocode_cache[key] = self.geo.geocode(city, region)
+        return coords
+
+    def _fill_nearest_cache(self, coords: List[Tuple[float, float]]) -> None:
+        """Nearest office for many (lat, lon) points in one kernel call."""
+        coords = [c for c in dict.fromkeys(coords) if c not in self._nearest_cache]
+        if not coords or not len(self._office_names):
+            return
+        idx, dist = self._nearest_office_vec(
+            np.array([c[0] for c in coords], dtype=float),
+            np.array([c[1] for c in coords], dtype=float),
+        )
+        for c, i, d in zip(coords, idx, dist):
+            self._nearest_cache[c] = (self._office_names[i], round(float(d), 2))
+
     def _nearest_office_by_coords(
         self, lat: float, lon: float, exclude: Optional[str] = None
     ) -> Tuple[Optional[str], Optional[float]]:
-        best_office: Optional[str] = None
-        best_dist: float = float("inf")
-        for office, (olat, olon) in self._office_coords.items():
-            if office == exclude:
-                continue
-            d = self.geo.distance_km(lat, lon, olat, olon)
-            if d < best_dist:
-                best_dist = d
-                best_office = office
-        return (best_office, round(best_dist, 2)) if best_office else (None, None)
+        if not len(self._office_names):
+            return None, None
+        if exclude is None:
+            cached = self._nearest_cache.get((lat, lon))
+            if cached is None:
+                self._fill_nearest_cache([(lat, lon)])
+                cached = self._nearest_cache[(lat, lon)]
+            return cached
+        d = self._office_distances([lat], [lon])[0]
+        d[self._office_names == exclude] = np.inf
+        i = int(d.argmin())
+        if not np.isfinite(d[i]):
+            return None, None
+        return self._office_names[i], round(float(d[i]), 2)
 
     def _offices_sorted_by_distance(
         self, lat: float, lon: float
     ) -> List[Tuple[str, float]]:
-        result = [
-            (office, round(self.geo.distance_km(lat, lon, olat, olon), 2))
-            for office, (olat, olon) in self._office_coords.items()
-        ]
-        result.sort(key=lambda x: x[1])
+        """All offices by rounded distance, ties in units order; cached per coords."""
+        cached = self._by_distance_cache.get((lat, lon))
+        if cached is not None:
+            return cached
+        if not len(self._office_names):
+            return []
+        d = self._office_distances([lat], [lon])[0]
+        rounded = [round(float(x), 2) for x in d]
+        order = np.argsort(rounded, kind="stable")
+        result = [(self._office_names[i], rounded[i]) for i in order]
+        self._by_distance_cache[(lat, lon)] = result
         return result
 
     def get_office(
-        self, ticket: pd.Series
+        self,
+        city: str,
+        city_norm: str,
+        region: str,
+        is_kz: bool,
+        is_unknown_country: bool,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        nearest: Optional[Tuple[str, float]] = None,
     ) -> Tuple[str, str, Optional[float]]:
-        """Decide home office → (office, reason, distance_km)."""
-        country = str(ticket.get("country", "")).lower().strip()
-        city_raw = str(ticket.get("city", "")).strip()
-        region = str(ticket.get("region", "")).strip()
+        """Decide home office → (office, reason, distance_km).
+
+        City and country arrive pre-classified from _prepare_tickets.
+        `nearest` is the precomputed nearest office for the ticket's own
+        coords (see distribute); it is computed here when omitted.
+        """
+        located = self._locate_office(city, city_norm, region, lat, lon, nearest)
+        if located is not None:
+            return located
+        return self._fallback_office(is_kz, is_unknown_country)
 
-        # Use pre-cleaned city; also try region for geocoding
-        lat = ticket.get("lat")
-        lon = ticket.get("lon")
+    def _locate_office(
+        self,
+        city: str,
+        city_norm: str,
+        region: str,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        nearest: Optional[Tuple[str, float]] = None,
+    ) -> Optional[Tuple[str, str, Optional[float]]]:
+        """Steps 1–3 of get_office: pure in the ticket's location, so cacheable."""
+        city_raw = str(city).strip()
+        region = str(region).strip()
 
         # 1. Explicit coords in ticket
         if pd.notna(lat) and pd.notna(lon):
-            nearest, dist = self._nearest_office_by_coords(float(lat), float(lon))
-            if nearest:
-                return nearest, "by_coords", dist
+            if nearest is None:
+                nearest = self._nearest_office_by_coords(float(lat), float(lon))
+            office, dist = nearest
+            if office:
+                return office, "by_coords", dist
 
         # 2. Geocode city (with region fallback inside GeoNormalizer)
-        city_lat, city_lon = self.geo.geocode(city_raw, region)
+        city_lat, city_lon = self._geocode(city_raw, region)
         if city_lat is not None:
-            nearest, dist = self._nearest_office_by_coords(city_lat, city_lon)
-            if nearest:
-                return nearest, "by_distance", dist
+            office, dist = self._nearest_office_by_coords(city_lat, city_lon)
+            if office:
+                return office, "by_distance", dist
 
         # 3. Substring match city vs office names
-        city_norm = self.geo.normalise(city_raw)
-        for off in self.units["office"].tolist():
-            off_norm = self.geo.normalise(off)
-            if off_norm and city_norm and (off_norm in city_norm or city_norm in off_norm):
-                return off, "by_match", None
+        if city_norm:
+            for off, off_norm in self._units_norm:
+                if off_norm in city_norm or city_norm in off_norm:
+                    return off, "by_match", None
+
+        return None
 
+    def _fallback_office(
+        self, is_kz: bool, is_unknown_country: bool
+    ) -> Tuple[str, str, Optional[float]]:
+        """Steps 4–5 of get_office; the 50/50 counter makes this order-dependent."""
         # 4. Non-KZ country → 50/50 Astana/Almaty round-robin
-        is_kz = "kaz" in country or "каз" in country
-        is_unk = country in ("", "nan", "none")
-        if not is_kz and not is_unk:
+        if not is_kz and not is_unknown_country:
             off = [self.astana_office, self.almaty_office][self.unknown_loc_counter % 2]
             self.unknown_loc_counter += 1
             return off, "50_50", None
@@ -244,52 +439,76 @@ class FIREEngine:
     # FILTER + SELECT
     # ──────────────────────────────────────────────────────────────────────────
 
-    def _apply_filters(
+    @staticmethod
+    def _candidates(
+        bucket: Dict[str, np.ndarray],
+        vip: bool,
+        chief: bool,
+        lang: Optional[str],
+    ) -> np.ndarray:
+        """Positions of bucket managers passing the filters (combo table lookup)."""
+        return bucket["combos"][(vip, chief, lang)]
+
+    def _filter_candidates(
         self,
-        pool: pd.DataFrame,
+        bucket: Dict[str, np.ndarray],
         segment: str,
         ai_type: str,
         ai_lang: str,
-    ) -> pd.DataFrame:
-        s = pool.copy()
-        if segment in ("VIP", "PRIORITY"):
-            s = s[s["skills_set"].apply(lambda x: "VIP" in x)]
-        if ai_type == "Смена данных":
-            s = s[s["is_chief"]]
-        if ai_lang in ("KZ", "ENG"):
-            s = s[s["skills_set"].apply(lambda x: ai_lang in x)]
-        return s
-
-    def _select_manager(self, subset: pd.DataFrame, rr_key: tuple) -> pd.Series:
+    ) -> np.ndarray:
+        return self._candidates(
+            bucket,
+            segment in ("VIP", "PRIORITY"),
+            ai_type == "Смена данных",
+            ai_lang if ai_lang in ("KZ", "ENG") else None,
+        )
+
+    def _rr_next(self, bucket: Dict[str, np.ndarray], ai_lang: str) -> int:
+        """Current RR counter for (office, language); advances it by one."""
+        lid = self._lang_ids.get(ai_lang)
+        if lid is None:
+            lid = self._lang_ids[ai_lang] = len(self._lang_ids)
+            if lid >= self._rr.shape[1]:
+                self._rr = np.pad(self._rr, ((0, 0), (0, self._rr.shape[1])))
+        oid = bucket["id"]
+        idx = int(self._rr[oid, lid])
+        self._rr[oid, lid] = idx + 1
+        return idx
+
+    def _select_manager(
+        self, bucket: Dict[str, np.ndarray], cand: np.ndarray, ai_lang: str
+    ) -> Tuple[str, List[str]]:
         """
         Weighted Round-Robin:
         - If max-min load spread > 3 → always take least loaded (fair)
         - Otherwise RR among top-2
+        Returns (selected name, top-2 names by load before this assignment).
         """
-        subset = subset.copy().sort_values(["load", "name"], kind="mergesort")
-        loads = subset["load"].values
-        if len(loads) > 1 and (loads.max() - loads.min()) > 3:
+        loads = bucket["load"][cand]
+        # (load, name) as one int key — buckets are name-sorted, so the
+        # position is the name tie-breaker; only the two smallest need ordering
+        key = loads * len(bucket["name"]) + cand
+        if len(cand) > 2:
+            first2 = np.argpartition(key, 1)[:2]
+        else:
+            first2 = np.arange(len(cand))
+        top2 = cand[first2[np.argsort(key[first2])]]
+        if len(cand) > 1 and (loads.max() - loads.min()) > 3:
             # Large spread — pick least loaded always
-            selected = subset.iloc[0]
+            pos = top2[0]
         else:
-            top2 = subset.head(2)
-            idx = self.rr_counters.get(rr_key, 0)
-            selected = top2.iloc[idx % len(top2)]
-            self.rr_counters[rr_key] = idx + 1
+            pos = top2[self._rr_next(bucket, ai_lang) % len(top2)]
 
-        self.managers.at[selected.name, "load"] += 1
-        return selected
+        bucket["load"][pos] += 1
+        self._assigned.append(bucket["rows"][pos])
+        return bucket["name"][pos], bucket["name"][top2].tolist()
 
     def _get_ticket_coords(
-        self, ticket: pd.Series
+        self, lat: Optional[float], lon: Optional[float], city: str, region: str
     ) -> Tuple[Optional[float], Optional[float]]:
-        lat = ticket.get("lat")
-        lon = ticket.get("lon")
         if pd.notna(lat) and pd.notna(lon):
             return float(lat), float(lon)
-        city = str(ticket.get("city", ""))
-        region = str(ticket.get("region", ""))
-        return self.geo.geocode(city, region)
+        return self._geocode(str(city).strip(), str(region).strip())
 
     # ──────────────────────────────────────────────────────────────────────────
     # HIERARCHICAL FALLBACK (especially for VIP)
@@ -297,75 +516,79 @@ class FIREEngine:
 
     def _find_nearest_manager(
         self,
-        ticket: pd.Series,
+        coords: Tuple[Optional[float], Optional[float], str, str],
         current_office: str,
         segment: str,
         ai_type: str,
         ai_lang: str,
-    ) -> Tuple[Optional[pd.Series], Optional[str], Optional[float]]:
+    ) -> Tuple[Optional[str], Optional[str], Optional[float]]:
         """
         Multi-pass search in nearby offices:
           Pass 1: full filters (VIP + chief + lang)
           Pass 2: VIP + chief, no lang filter
           Pass 3: VIP only (no chief, no lang)
           Pass 4: any manager from nearest office
+        `coords` is the ticket's (lat, lon, city, region).
         """
-        lat, lon = self._get_ticket_coords(ticket)
+        lat, lon = self._get_ticket_coords(*coords)
 
         if lat is None:
             # No coordinates → fallback to Astana or Almaty
             for fallback_off in [self.astana_office, self.almaty_office]:
                 if fallback_off == current_office:
                     continue
-                pool = self.managers[self.managers["office"] == fallback_off].copy()
+                bucket = self._bucket(fallback_off)
                 for pass_filters in self._filter_passes(segment, ai_type, ai_lang):
-                    sub = pass_filters(pool)
-                    if not sub.empty:
-                        sel = self._select_manager(sub, (fallback_off, ai_lang))
+                    cand = pass_filters(bucket)
+                    if len(cand):
+                        sel, _ = self._select_manager(bucket, cand, ai_lang)
                         return sel, fallback_off, None
             return None, None, None
 
-        offices_by_dist = self._offices_sorted_by_distance(lat, lon)
+        # Offices without managers can never match — resolve buckets once, skip those
+        offices_by_dist = [
+            (office, dist, self._office_buckets[office])
+            for office, dist in self._offices_sorted_by_distance(lat, lon)
+            if office != current_office and office in self._office_buckets
+        ]
 
         # Run each pass across all offices before degrading to next pass
         for pass_filters in self._filter_passes(segment, ai_type, ai_lang):
-            for office, dist in offices_by_dist:
-                if office == current_office:
-                    continue
-                pool = self.managers[self.managers["office"] == office].copy()
-                sub = pass_filters(pool)
-                if not sub.empty:
-                    sel = self._select_manager(sub, (office, ai_lang))
+            for office, dist, bucket in offices_by_dist:
+                cand = pass_filters(bucket)
+                if len(cand):
+                    sel, _ = self._select_manager(bucket, cand, ai_lang)
                     return sel, office, dist
 
         return None, None, None
 
     def _filter_passes(self, segment: str, ai_type: str, ai_lang: str):
+        """Filter passes for a ticket profile, built once per (segment, ai_type, ai_lang)."""
+        key = (segment, ai_type, ai_lang)
+        passes = self._filter_pass_cache.get(key)
+        if passes is None:
+            passes = self._filter_pass_cache[key] = self._build_passes(segment, ai_type, ai_lang)
+        return passes
+
+    def _build_passes(self, segment: str, ai_type: str, ai_lang: str):
         """
-        Generator of filter functions from strictest to most lenient.
+        Generator of filter functions (bucket → candidates) from strictest to most lenient.
         """
         is_vip = segment in ("VIP", "PRIORITY")
         is_chief_required = ai_type == "Смена данных"
         is_lang_required = ai_lang in ("KZ", "ENG")
 
-        def full(pool):
-            return self._apply_filters(pool, segment, ai_type, ai_lang)
+        def full(bucket):
+            return self._filter_candidates(bucket, segment, ai_type, ai_lang)
 
-        def no_lang(pool):
-            s = pool.copy()
-            if is_vip:
-                s = s[s["skills_set"].apply(lambda x: "VIP" in x)]
-            if is_chief_required:
-                s = s[s["is_chief"]]
-            return s
+        def no_lang(bucket):
+            return self._candidates(bucket, is_vip, is_chief_required, None)
 
-        def vip_only(pool):
-            if not is_vip:
-                return pool.copy()
-            return pool[pool["skills_set"].apply(lambda x: "VIP" in x)].copy()
+        def vip_only(bucket):
+            return self._candidates(bucket, is_vip, False, None)
 
-        def any_manager(pool):
-            return pool.copy()
+        def any_manager(bucket):
+            return self._candidates(bucket, False, False, None)
 
         passes = [full]
         if is_lang_required:
@@ -380,63 +603,131 @@ class FIREEngine:
     # DISTRIBUTE
     # ──────────────────────────────────────────────────────────────────────────
 
-    def distribute(self) -> pd.DataFrame:
-        results: List[Dict[str, Any]] = []
+    def distribute(self, trace_format: str = "json") -> pd.DataFrame:
+        """
+        Route every ticket → one result row per ticket.
+        trace_format="json" returns the trace column as JSON strings;
+        "dict" leaves plain dicts for callers that serialize it themselves.
+        """
+        if trace_format not in ("json", "dict"):
+            raise ValueError(f"Unknown trace_format: {trace_format!r}")
+
+        # Pull every ticket field once as a plain list instead of per-row Series lookups
+        n = len(self.tickets)
+
+        def column(name: str, default: Any) -> List[Any]:
+            if name in self.tickets.columns:
+                return self.tickets[name].tolist()
+            return [default] * n
+
+        guids = column("guid", None)
+        cities = column("city", "")
+        city_norms = column("city_norm", "")
+        is_kz = column("is_kz", False)
+        is_unknown_country = column("is_unknown_country", True)
+        regions = column("region", "")
+        lats = column("lat", None)
+        lons = column("lon", None)
+        segments = column("segment", "MASS")
+        ai_types = column("ai_type", "Консультация")
+        ai_langs = column("ai_lang", "RU")
+        priorities = column("priority", 5)
+        sentiments = column("sentiment", "")
+        summaries = column("summary", "")
+        recommendations = column("recommendation", "")
+
+        # Location part of get_office resolved once per distinct
+        # (city, region, lat, lon); NaN coords are keyed as None
+        lats = [la if pd.notna(la) else None for la in lats]
+        lons = [lo if pd.notna(lo) else None for lo in lons]
+        loc_keys = list(zip(cities, city_norms, regions, lats, lons))
+        uniq = list(dict.fromkeys(loc_keys))
+
+        # Geocode every distinct (city, region) of locations without own coords at once
+        no_coords = [k for k in uniq if k[3] is None or k[4] is None]
+        self._geocode_cache.update(self.geo.geocode_many(
+            p for p in ((str(k[0]).strip(), str(k[2]).strip()) for k in no_coords)
+            if p not in self._geocode_cache
+        ))
+
+        # Nearest office for every own or geocoded point — one kernel call
+        points = [(float(k[3]), float(k[4])) for k in uniq if k[3] is not None and k[4] is not None]
+        for k in no_coords:
+            city_lat, city_lon = self._geocode(str(k[0]).strip(), str(k[2]).strip())
+            if city_lat is not None:
+                points.append((city_lat, city_lon))
+        self._fill_nearest_cache(points)
+
+        located = {k: self._locate_office(*k) for k in uniq}
+
+        # Home office per ticket, in ticket order (50/50 counter depends on it)
+        homes = [
+            located[k] or self._fallback_office(kz, unk)
+            for k, kz, unk in zip(loc_keys, is_kz, is_unknown_country)
+        ]
 
-        for _, ticket in self.tickets.iterrows():
+        # Manager filtering is done once per (office, segment, ai_type, ai_lang)
+        # group; only the load-based selection below stays per ticket, since
+        # every assignment changes the loads the next one is weighed against.
+        keys = list(zip([h[0] for h in homes], segments, ai_types, ai_langs))
+        groups: Dict[Tuple[str, str, str, str], Tuple[Dict[str, np.ndarray], np.ndarray]] = {}
+        for key in dict.fromkeys(keys):
+            office, segment, ai_type, ai_lang = key
+            bucket = self._bucket(office)
+            groups[key] = (bucket, self._filter_candidates(bucket, segment, ai_type, ai_lang))
+
+        # Output columns, filled in place; the DataFrame is built once at the end
+        out_office: List[str] = [None] * n
+        out_reason: List[str] = [None] * n
+        out_distance: List[Optional[float]] = [None] * n
+        out_manager: List[str] = [None] * n
+        out_trace: List[Dict[str, Any]] = [None] * n
+
+        for i, ((office, office_reason, distance_km), key) in enumerate(zip(homes, keys)):
             t_start = time.time()
 
-            ai_type = ticket.get("ai_type", "Консультация")
-            ai_lang = ticket.get("ai_lang", "RU")
-            priority = ticket.get("priority", 5)
-            segment = ticket.get("segment", "MASS")
+            _, segment, ai_type, ai_lang = key
 
-            office, office_reason, distance_km = self.get_office(ticket)
-
-            pool = self.managers[self.managers["office"] == office].copy()
+            bucket, cand = groups[key]
+            n_suitable = len(cand)
             trace: Dict[str, Any] = {
                 "home_office":    office,
                 "office_reason":  office_reason,
                 "distance_km":    distance_km,
-                "initial_pool":   int(len(pool)),
+                "initial_pool":   len(bucket["name"]),
             }
 
-            subset = self._apply_filters(pool, segment, ai_type, ai_lang)
-
             if segment in ("VIP", "PRIORITY"):
-                trace["after_vip"] = int(len(subset))
+                trace["after_vip"] = n_suitable
             if ai_type == "Смена данных":
-                trace["after_chief"] = int(len(subset))
+                trace["after_chief"] = n_suitable
             if ai_lang in ("KZ", "ENG"):
-                trace["after_lang"] = int(len(subset))
+                trace["after_lang"] = n_suitable
 
             elapsed_ms = int((time.time() - t_start) * 1000)
 
-            if not subset.empty:
-                rr_key = (office, ai_lang)
-                selected = self._select_manager(subset, rr_key)
-                manager_name = selected["name"]
+            if n_suitable:
+                manager_name, top2 = self._select_manager(bucket, cand, ai_lang)
                 trace.update({
                     "escalation": False,
                     "selected": manager_name,
                     "routing_ms": elapsed_ms,
-                    "top2": subset.sort_values(["load", "name"]).head(2)["name"].tolist(),
+                    "top2": top2,
                 })
-                results.append(self._build_row(
-                    ticket, ai_type, ai_lang, priority, segment,
-                    office, office_reason, distance_km, manager_name, trace
-                ))
+                out_office[i], out_reason[i], out_distance[i] = office, office_reason, distance_km
+                out_manager[i], out_trace[i] = manager_name, trace
                 continue
 
             # No suitable manager in home office → search nearby
             trace["escalation_reason"] = "no_suitable_manager_in_home_office"
             near_mgr, near_office, near_dist = self._find_nearest_manager(
-                ticket, office, segment, ai_type, ai_lang
+                (lats[i], lons[i], cities[i], regions[i]),
+                office, segment, ai_type, ai_lang,
             )
             elapsed_ms = int((time.time() - t_start) * 1000)
 
             if near_mgr is not None:
-                manager_name = near_mgr["name"]
+                manager_name = near_mgr
                 trace.update({
                     "escalation": False,
                     "redirected_to_office": near_office,
@@ -444,38 +735,28 @@ class FIREEngine:
                     "selected": manager_name,
                     "routing_ms": elapsed_ms,
                 })
-                results.append(self._build_row(
-                    ticket, ai_type, ai_lang, priority, segment,
-                    near_office, "nearest_office", near_dist, manager_name, trace
-                ))
+                out_office[i], out_reason[i], out_distance[i] = near_office, "nearest_office", near_dist
+                out_manager[i], out_trace[i] = manager_name, trace
             else:
                 trace["escalation"] = True
                 trace["routing_ms"] = elapsed_ms
-                results.append(self._build_row(
-                    ticket, ai_type, ai_lang, priority, segment,
-                    office, office_reason, distance_km, "CAPITAL_ESCALATION", trace
-                ))
-
-        return pd.DataFrame(results)
-
-    @staticmethod
-    def _build_row(
-        ticket: pd.Series,
-        ai_type: str, ai_lang: str, priority: int, segment: str,
-        office: str, office_reason: str, distance_km: Optional[float],
-        manager: str, trace: Dict[str, Any],
-    ) -> Dict[str, Any]:
-        return {
-            "guid":           ticket["guid"],
-            "ai_type":        ai_type,
-            "ai_lang":        ai_lang,
-            "priority":       priority,
-            "sentiment":      ticket.get("sentiment", ""),
-            "summary":        ticket.get("summary", ""),
-            "recommendation": ticket.get("recommendation", ""),
-            "office":         office,
-            "office_reason":  office_reason,
-            "distance_km":    distance_km,
-            "manager":        manager,
-            "trace":          json.dumps(trace, ensure_ascii=False),
-        }
\ No newline at end of file
+                out_office[i], out_reason[i], out_distance[i] = office, office_reason, distance_km
+                out_manager[i], out_trace[i] = "CAPITAL_ESCALATION", trace
+
+        self._sync_loads()
+        if trace_format == "json":
+            out_trace = [_trace_json(t) for t in out_trace]
+        return pd.DataFrame({
+            "guid":           guids,
+            "ai_type":        ai_types,
+            "ai_lang":        ai_langs,
+            "priority":       priorities,
+            "sentiment":      sentiments,
+            "summary":        summaries,
+            "recommendation": recommendations,
+            "office":         out_office,
+            "office_reason":  out_reason,
+            "distance_km":    out_distance,
+            "manager":        out_manager,
+            "trace":          out_trace,
+        })
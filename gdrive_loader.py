@@ -4,6 +4,7 @@
 Установка:
     pip install gdown python-magic-bin  (Windows)
     pip install gdown python-magic      (Linux/Mac)
+    aria2c (необязательно) — если есть в PATH, архив качается в несколько потоков
 
 Использование:
     python gdrive_loader.py --url "https://drive.google.com/file/d/.../view"
@@ -13,11 +14,15 @@
 """
 
 import os
+import re
 import logging
+import subprocess
 import zipfile
 import tarfile
+import shutil
 import hashlib
 import argparse
+from typing import Optional
 
 import gdown
 
@@ -39,7 +44,24 @@ ARCHIVE_DIR = os.path.join(WORK_DIR, "archives")
 EXTRACT_DIR = os.path.join(WORK_DIR, "extracted")
 LOG_FILE    = os.path.join(WORK_DIR, "process.log")
 
-REMOVE_EXTENSIONS = [".txt", ".md", ".url", ".DS_Store"]
+REMOVE_EXTENSIONS = (".txt", ".md", ".url", ".DS_Store")  # tuple — сразу для str.endswith
+
+HASH_BLOCK_SIZE = 1 << 20  # 1 MiB — блок чтения для sha256 без file_digest
+COPY_BLOCK_SIZE = 1 << 20  # 1 MiB — блок записи при распаковке
+
+# Фильтр "data" из stdlib (Python 3.12+, бэкпорты в 3.8–3.11): без setuid-битов,
+# устройств и ссылок за пределы каталога. Где его нет — только наши проверки.
+TAR_EXTRACT_KWARGS = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+# aria2c (если установлен) качает архив в несколько потоков через Range-запросы
+DOWNLOAD_CONNECTIONS = 8
+# Зависание ловит сам aria2c, а не общий лимит на всю загрузку: соединение,
+# которое молчит DOWNLOAD_STALL_TIMEOUT сек или качает медленнее
+# DOWNLOAD_LOWEST_SPEED, обрывается; после DOWNLOAD_MAX_TRIES попыток — выход с ошибкой
+DOWNLOAD_STALL_TIMEOUT = 60
+DOWNLOAD_LOWEST_SPEED = "10K"
+DOWNLOAD_MAX_TRIES = 5
+DRIVE_DIRECT_URL = "https://drive.usercontent.google.com/download?id={id}&export=download&confirm=t"
 
 # Имена CSV файлов которые ищем после распаковки
 CSV_NAMES = {
@@ -73,11 +95,64 @@ def is_folder_url(url: str) -> bool:
 # --------------------------------------------------
 # Download
 # --------------------------------------------------
+def _drive_file_id(url: str) -> Optional[str]:
+    """ID файла из ссылки вида /file/d/<id>/... или ?id=<id>."""
+    m = re.search(r"/file/d/([\w-]+)", url) or re.search(r"[?&]id=([\w-]+)", url)
+    return m.group(1) if m else None
+
+
+def _download_aria2(url: str, output: str) -> bool:
+    """
+    Многопоточная загрузка прямой ссылки через aria2c.
+    False — если aria2c нет, ссылка не распознана, сервер вернул не файл
+    или загрузка встала; тогда download_file откатывается на gdown.
+    """
+    aria2c = shutil.which("aria2c")
+    file_id = _drive_file_id(url)
+    if not aria2c or not file_id:
+        return False
+
+    n = str(DOWNLOAD_CONNECTIONS)
+    logging.info(f"Downloading with aria2c ({n} connections): {file_id}")
+    result = subprocess.run([
+        aria2c, "-x", n, "-s", n, "-k", "1M",
+        "--allow-overwrite=true", "--auto-file-renaming=false",
+        f"--timeout={DOWNLOAD_STALL_TIMEOUT}",
+        f"--lowest-speed-limit={DOWNLOAD_LOWEST_SPEED}",
+        f"--max-tries={DOWNLOAD_MAX_TRIES}",
+        "-d", os.path.dirname(output), "-o", os.path.basename(output),
+        DRIVE_DIRECT_URL.format(id=file_id),
+    ])
+    if result.returncode != 0 or not os.path.exists(output):
+        logging.warning(f"aria2c failed (code {result.returncode}), fallback to gdown")
+        _remove_partial(output)
+        return False
+
+    # Вместо файла пришла HTML-страница (подтверждение/доступ) — пусть разбирается gdown
+    with open(output, "rb") as f:
+        head = f.read(512).lstrip().lower()
+    if head.startswith(b"<!doctype") or head.startswith(b"<html"):
+        logging.warning("aria2c got an HTML page, fallback to gdown")
+        _remove_partial(output)
+        return False
+    return True
+
+
+def _remove_partial(output: str):
+    """Недокачанный архив и служебный .aria2 не должны остаться рядом с файлом gdown."""
+    for path in (output, output + ".aria2"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
 def download_file(url: str) -> str:
     """Скачивает файл из Google Drive. Возвращает путь к скачанному файлу."""
     output = os.path.join(ARCHIVE_DIR, "archive")
     logging.info(f"Downloading file: {url}")
-    path = gdown.download(url, output, fuzzy=True, quiet=False)
+    if _download_aria2(url, output):
+        path = output
+    else:
+        path = gdown.download(url, output, fuzzy=True, quiet=False)
     if not path or not os.path.exists(path):
         raise Exception(
             "Файл не скачался. Проверь ссылку и доступ "
@@ -100,10 +175,27 @@ def download_folder(url: str) -> None:
 def detect_archive_type(path: str) -> str:
     """Определяет тип архива по сигнатуре файла."""
 
-    # 1. Пробуем python-magic если доступен
+    # Читаем заголовок один раз — все проверки ниже работают по буферу
+    # (512 байт покрывают и tar-заголовок с сигнатурой "ustar" на смещении 257)
+    with open(path, "rb") as f:
+        head = f.read(512)
+
+    # 1. Магические байты
+    if head[:2] == b"PK":
+        return "zip"
+    if head[:2] == b"\x1f\x8b":
+        return "tar.gz"
+    if head[:3] == b"BZh":
+        return "tar.bz2"
+    if head[:6] == b"\xfd7zXZ\x00":
+        return "tar.xz"
+    if head[257:262] == b"ustar":
+        return "tar"
+
+    # 2. python-magic если доступен — только когда сигнатура не распознана
     if MAGIC_AVAILABLE:
         try:
-            mime = magic.from_file(path, mime=True)
+            mime = magic.from_buffer(head, mime=True)
             logging.info(f"MIME type: {mime}")
             if mime == "application/zip":
                 return "zip"
@@ -118,30 +210,16 @@ def detect_archive_type(path: str) -> str:
         except Exception as e:
             logging.warning(f"MIME detection failed: {e}")
 
-    # 2. Проверяем магические байты
-    with open(path, "rb") as f:
-        sig = f.read(8)
-
-    if sig[:2] == b"PK":
-        return "zip"
-    if sig[:2] == b"\x1f\x8b":
-        return "tar.gz"
-    if sig[:3] == b"BZh":
-        return "tar.bz2"
-    if sig[:6] == b"\xfd7zXZ\x00":
-        return "tar.xz"
-
-    # 3. Пробуем tarfile как fallback (он сам умеет определять формат)
+    # 3. Пробуем tarfile как fallback (старые tar без "ustar")
     if tarfile.is_tarfile(path):
         return "tar"
 
-    # 4. Последняя попытка — zipfile
+    # 4. Последняя попытка — zipfile (zip с данными перед архивом)
     if zipfile.is_zipfile(path):
         return "zip"
 
     # Диагностика: покажем первые байты чтобы понять что пришло
-    with open(path, "rb") as f:
-        header = f.read(64)
+    header = head[:64]
     logging.error(f"Unknown format. First bytes: {header!r}")
     print(f"  ⚠ Первые байты файла: {header!r}")
 
@@ -159,28 +237,77 @@ def detect_archive_type(path: str) -> str:
     raise Exception(f"Неподдерживаемый формат архива. Первые байты: {header!r}")
 
 
+def _extract_root() -> str:
+    """realpath(EXTRACT_DIR) с завершающим разделителем — считается один раз на архив.
+    Разделитель на конце не даёт '/data/extracted2' пройти проверку префикса '/data/extracted'."""
+    return os.path.join(os.path.realpath(EXTRACT_DIR), "")
+
+
+def _safe_target(root: str, name: str) -> str:
+    """Путь внутри root (из _extract_root) или None, если имя выводит за его пределы."""
+    target = os.path.realpath(os.path.join(root, name))
+    if not target.startswith(root) and target + os.sep != root:
+        return None
+    return target
+
+
 def safe_extract_zip(path: str):
-    """Безопасная распаковка ZIP с защитой от Zip Slip."""
-    real_extract = os.path.realpath(EXTRACT_DIR)
+    """Безопасная распаковка ZIP с защитой от Zip Slip.
+    Проверка идёт по центральному каталогу (без чтения данных), затем каждый
+    файл распаковывается потоком блоками COPY_BLOCK_SIZE.
+    """
+    root = _extract_root()
     with zipfile.ZipFile(path) as z:
+        members = []
         for member in z.infolist():
-            extracted_path = os.path.realpath(os.path.join(EXTRACT_DIR, member.filename))
-            if not extracted_path.startswith(real_extract + os.sep) and extracted_path != real_extract:
+            target = _safe_target(root, member.filename)
+            if target is None:
                 raise Exception(f"Zip Slip detected: {member.filename}")
-        z.extractall(EXTRACT_DIR)
+            members.append((member, target))
+
+        for member, target in members:
+            # Мусор (REMOVE_EXTENSIONS) не пишем на диск вовсе
+            if member.filename.endswith(REMOVE_EXTENSIONS):
+                continue
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with z.open(member) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BLOCK_SIZE)
 
 
-def safe_extract_tar(path: str, mode: str = "r:*"):
+def safe_extract_tar(path: str, mode: str = "r|*"):
     """Безопасная распаковка TAR с защитой от Path Traversal.
-    mode='r:*' позволяет tarfile самому определить сжатие (gz, bz2, xz, plain).
+    mode='r|*' — потоковое чтение: сжатие (gz, bz2, xz, plain) определяется само,
+    архив распаковывается за один проход, без повторного разжатия ради getmembers().
+    Хардлинк распаковывается, только если его цель уже на диске: в потоке
+    назад не перемотать. Остальные такие члены пропускаются, а не обрывают загрузку.
     """
-    real_extract = os.path.realpath(EXTRACT_DIR)
+    root = _extract_root()
+    extracted = set()
     with tarfile.open(path, mode) as tar:
-        for member in tar.getmembers():
-            member_path = os.path.realpath(os.path.join(EXTRACT_DIR, member.name))
-            if not member_path.startswith(real_extract + os.sep) and member_path != real_extract:
+        for member in tar:
+            if _safe_target(root, member.name) is None:
                 raise Exception(f"Tar Path Traversal detected: {member.name}")
-        tar.extractall(EXTRACT_DIR)
+            # Ссылка внутри каталога, но указывающая наружу, тоже опасна:
+            # симлинк считается от своего каталога, хардлинк — от корня архива
+            if member.issym() or member.islnk():
+                base = os.path.dirname(member.name) if member.issym() else ""
+                if _safe_target(root, os.path.join(base, member.linkname)) is None:
+                    raise Exception(f"Tar link outside extract dir: {member.name} -> {member.linkname}")
+            # Мусор (REMOVE_EXTENSIONS) не пишем на диск вовсе
+            if (member.isfile() or member.islnk()) and member.name.endswith(REMOVE_EXTENSIONS):
+                continue
+            if member.islnk() and os.path.normpath(member.linkname) not in extracted:
+                logging.warning(f"Skip hardlink to a member that was not extracted: {member.name}")
+                continue
+            try:
+                tar.extract(member, EXTRACT_DIR, **TAR_EXTRACT_KWARGS)
+            except tarfile.StreamError as e:
+                logging.warning(f"Skip tar member {member.name}: {e}")
+                continue
+            extracted.add(os.path.normpath(member.name))
 
 
 def extract_archive(path: str):
@@ -196,8 +323,8 @@ def extract_archive(path: str):
     if t == "zip":
         safe_extract_zip(path)
     elif t in ("tar", "tar.gz", "tar.bz2", "tar.xz"):
-        # mode="r:*" — tarfile сам разберётся со сжатием
-        safe_extract_tar(path, mode="r:*")
+        # mode="r|*" — tarfile сам разберётся со сжатием, читая архив потоком
+        safe_extract_tar(path, mode="r|*")
     else:
         raise Exception(f"Неподдерживаемый формат: {t}")
 
@@ -205,18 +332,62 @@ def extract_archive(path: str):
     print("  Распаковка завершена.")
 
 
+# --------------------------------------------------
+# Scan
+# --------------------------------------------------
+def _iter_files(root: str):
+    """
+    Файлы под root (DirEntry) в том же порядке, что и os.walk: сначала файлы
+    каталога, потом подкаталоги. Тип берётся из DirEntry — без лишних stat.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        if not entry.is_dir():
+            yield entry
+    for entry in entries:
+        # Симлинки на каталоги os.walk не обходит — и мы не обходим
+        if entry.is_dir() and not entry.is_symlink():
+            yield from _iter_files(entry.path)
+
+
+def scan_extract_dir() -> dict:
+    """
+    Один проход os.scandir по EXTRACT_DIR.
+    Возвращает {"remove": лишние файлы, "csv": {key: путь}, "files": остальные файлы (relpath)}.
+    """
+    wanted = {name.lower(): key for key, names in CSV_NAMES.items() for name in names}
+    scan = {"remove": [], "csv": {}, "files": []}
+    for entry in _iter_files(EXTRACT_DIR):
+        path = entry.path
+        if entry.name.endswith(REMOVE_EXTENSIONS):
+            scan["remove"].append(path)
+            continue
+        scan["files"].append(os.path.relpath(path, EXTRACT_DIR))
+        key = wanted.get(entry.name.lower())
+        if key is not None:
+            scan["csv"].setdefault(key, path)
+    return scan
+
+
 # --------------------------------------------------
 # Cleanup
 # --------------------------------------------------
-def cleanup_files():
+def cleanup_files(scan: dict = None):
+    """
+    Удаляет файлы с REMOVE_EXTENSIONS. Из архивов они не распаковываются,
+    так что это нужно для папок Drive (download_folder) и как проверка.
+    """
+    if scan is None:
+        scan = scan_extract_dir()
     removed = 0
-    for root, dirs, files in os.walk(EXTRACT_DIR):
-        for file in files:
-            path = os.path.join(root, file)
-            if any(file.endswith(ext) for ext in REMOVE_EXTENSIONS):
-                os.remove(path)
-                logging.info(f"Removed: {path}")
-                removed += 1
+    for path in scan["remove"]:
+        os.remove(path)
+        logging.info(f"Removed: {path}")
+        removed += 1
     logging.info(f"Cleanup: removed {removed} files")
     print(f"  Удалено лишних файлов: {removed}")
 
@@ -224,24 +395,18 @@ def cleanup_files():
 # --------------------------------------------------
 # Find CSVs
 # --------------------------------------------------
-def find_csv(key: str) -> str:
-    candidates = [c.lower() for c in CSV_NAMES[key]]
-    for root, dirs, files in os.walk(EXTRACT_DIR):
-        for f in files:
-            if f.lower() in candidates:
-                found = os.path.join(root, f)
-                logging.info(f"Found {key}: {found}")
-                return found
+def find_csv(key: str, scan: dict = None) -> str:
+    if scan is None:
+        scan = scan_extract_dir()
+    found = scan["csv"].get(key)
+    if found:
+        logging.info(f"Found {key}: {found}")
+        return found
 
     # Показываем что реально есть в архиве
-    found_files = []
-    for root, dirs, files in os.walk(EXTRACT_DIR):
-        for f in files:
-            found_files.append(os.path.relpath(os.path.join(root, f), EXTRACT_DIR))
-
     raise FileNotFoundError(
         f"Не найден файл для '{key}'. Ожидались: {CSV_NAMES[key]}\n"
-        f"Файлы в архиве: {found_files}"
+        f"Файлы в архиве: {scan['files']}"
     )
 
 
@@ -249,22 +414,27 @@ def find_csv(key: str) -> str:
 # DB helpers
 # --------------------------------------------------
 def sha256(path: str) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    with open(path, "rb", buffering=0) as f:
+        # Python 3.11+: весь цикл чтения и хеширования внутри C
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        buf = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            h.update(view[:n])
+        return h.hexdigest()
 
 
 def clear_all():
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute("TRUNCATE TABLE assignments  RESTART IDENTITY CASCADE;")
-            cur.execute("TRUNCATE TABLE ai_analysis  RESTART IDENTITY CASCADE;")
-            cur.execute("TRUNCATE TABLE tickets      RESTART IDENTITY CASCADE;")
-            cur.execute("TRUNCATE TABLE managers     RESTART IDENTITY CASCADE;")
-            cur.execute("TRUNCATE TABLE offices      RESTART IDENTITY CASCADE;")
+            # Одна команда на все таблицы — один round-trip и один захват блокировок
+            cur.execute(
+                "TRUNCATE TABLE assignments, ai_analysis, tickets, managers, offices "
+                "RESTART IDENTITY CASCADE;"
+            )
         conn.commit()
         print("[DB] Таблицы очищены")
         logging.info("DB cleared")
@@ -297,7 +467,8 @@ def main():
         print("\n1. Скачиваем папку из Google Drive...")
         download_folder(url)
         print("\n2. Очищаем лишние файлы...")
-        cleanup_files()
+        scan = scan_extract_dir()
+        cleanup_files(scan)
     else:
         # ---- Режим файла: скачиваем архив и распаковываем ----
         print("\n1. Скачиваем архив...")
@@ -310,12 +481,13 @@ def main():
         extract_archive(archive)
 
         print("\n3. Очищаем лишние файлы...")
-        cleanup_files()
+        scan = scan_extract_dir()
+        cleanup_files(scan)
 
     print("\n4. Ищем CSV файлы...")  # номер шага одинаковый в обоих режимах
-    tickets_path  = find_csv("tickets")
-    managers_path = find_csv("managers")
-    units_path    = find_csv("units")
+    tickets_path  = find_csv("tickets", scan)
+    managers_path = find_csv("managers", scan)
+    units_path    = find_csv("units", scan)
     print(f"   tickets:  {tickets_path}")
     print(f"   managers: {managers_path}")
     print(f"   units:    {units_path}")
@@ -1,96 +1,188 @@
 # run.py
 import os
 import time
+import asyncio
+import hashlib
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from engine import FIREEngine
-from ai.enricher import TicketEnricher
-from db import get_tickets_df, get_managers_df, get_offices_df, save_results
-
-# Сколько тикетов обогащать параллельно.
+from ai.enricher import TicketEnricher, LLM_MODEL
+from db import (
+    init_db, pooled_connection, get_tickets_df, get_reference_dfs, save_results,
+    get_ai_cache, save_ai_cache,
+)
+
+# Сколько пачек обогащать одновременно (на одном event loop). У пачки в полёте
+# всегда один LLM-запрос: сам батч, затем до MAX_SINGLE_RETRIES одиночных
+# повторов по очереди, так что это и есть число одновременных запросов к API.
 # 5 — безопасно для большинства LLM API (не триггерит rate limit).
-# Можно поднять до 8-10 если API не ругается.
-MAX_WORKERS = 20
+# Можно поднять, если API не ругается: потоков на это не тратится.
+MAX_WORKERS = 5
 
+# Сколько тикетов упаковывать в один LLM-запрос (summary + recommendation).
+BATCH_SIZE = 20
 
-def enrich_one(enricher: TicketEnricher, row: pd.Series) -> dict:
-    """Обогатить один тикет. Запускается в отдельном потоке."""
-    t0 = time.time()
+# Меняй при изменении промпта или формата ответа LLM — старые записи ai_cache перестанут совпадать
+AI_CACHE_VERSION = 2
+
+# В ai_cache хранится только ответ LLM; тип, тональность, координаты и т.п.
+# всегда считаются заново, чтобы правки rule-based логики не требовали сброса кеша
+_CACHED_LLM_FIELDS = ("summary", "recommendation")
+
+
+_FALLBACK_AI = {
+    "ai_type": "Консультация", "ai_lang": "RU",
+    "sentiment": "NEU", "priority": 5,
+    "summary": "", "recommendation": "",
+    "lat": None, "lon": None,
+}
+
+
+def _enricher_input(row: dict) -> dict:
+    return {
+        "text":    str(row.get("description", "") or ""),
+        "city":    str(row.get("city", "") or ""),
+        "segment": str(row.get("segment", "") or ""),
+    }
+
+
+def _cache_key(inp: dict) -> bytes:
+    """Ключ ai_cache: LLM видит только текст — тот же текст → тот же summary/recommendation."""
+    raw = f"{AI_CACHE_VERSION}|{LLM_MODEL}|{inp['text']}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+
+def enrich_one(enricher: TicketEnricher, row: dict) -> dict:
+    """Обогатить один тикет. Возвращает только AI-поля."""
     try:
-        ai_data = enricher.enrich({
-            "text":    str(row.get("description", "") or ""),
-            "city":    str(row.get("city", "") or ""),
-            "segment": str(row.get("segment", "") or ""),
-        })
+        return enricher.enrich(_enricher_input(row))
     except Exception as e:
         print(f"[WARN] enrich failed for {row.get('guid')}: {e}")
-        ai_data = {
-            "ai_type": "Консультация", "ai_lang": "RU",
-            "sentiment": "NEU", "priority": 5,
-            "summary": "", "recommendation": "",
-            "lat": None, "lon": None,
-        }
+        return _FALLBACK_AI
+
+
+async def enrich_batch(enricher: TicketEnricher, rows: list, limit: asyncio.Semaphore) -> list:
+    """Обогатить пачку тикетов одним LLM-запросом."""
+    async with limit:
+        t0 = time.time()
+        try:
+            ai_batch = await enricher.aenrich_batch([_enricher_input(row) for row in rows])
+        except Exception as e:
+            print(f"[WARN] batch enrich failed ({len(rows)} тикетов): {e} — по одному")
+            # Синхронный путь — в потоке, чтобы не блокировать event loop
+            ai_batch = await asyncio.to_thread(lambda: [enrich_one(enricher, row) for row in rows])
+
+        elapsed = time.time() - t0
+        if elapsed > 10:
+            print(f"  [SLOW] пачка из {len(rows)} тикетов — {elapsed:.1f}s (превышен лимит 10с)")
+        return ai_batch
+
+
+async def enrich_all(enricher: TicketEnricher, batches: list) -> list:
+    """Все пачки на одном event loop; AI-поля тикетов — в порядке пачек."""
+    limit = asyncio.Semaphore(MAX_WORKERS)
+    total = sum(len(batch) for batch in batches)
+    enriched_batches = [None] * len(batches)  # по индексу пачки — сохраняем порядок
+    t0 = time.time()
+    done = 0
+
+    async def run(idx: int, batch: list):
+        return idx, await enrich_batch(enricher, batch, limit)
 
-    elapsed = time.time() - t0
-    if elapsed > 10:
-        print(f"  [SLOW] guid={row.get('guid')} — {elapsed:.1f}s (превышен лимит 10с)")
+    # Собираем результаты по мере готовности
+    for next_done in asyncio.as_completed([run(idx, batch) for idx, batch in enumerate(batches)]):
+        idx, ai_batch = await next_done
+        enriched_batches[idx] = ai_batch
+        done += len(ai_batch)
+        print(f"  Обогащено: {done}/{total} | {time.time() - t0:.1f}s итого")
 
-    merged = row.to_dict()
-    merged.update(ai_data)
-    return merged
+    return [ai_data for batch in enriched_batches for ai_data in batch]
+
+
+def _chunks(items: list, size: int):
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
 
 
 def main():
     api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
     if api_key:
-        print(f"[LLM] Режим: LLM (ключ найден) | параллельность: {MAX_WORKERS} потоков")
+        print(f"[LLM] Режим: LLM (ключ найден) | параллельность: {MAX_WORKERS} пачек")
     else:
         print(f"[LLM] Режим: rule-based (ключ не найден)")
 
-    print("Читаем данные из БД...")
-    tickets_df  = get_tickets_df()
-    managers_df = get_managers_df()
-    units_df    = get_offices_df()
-
-    print(f"  Тикетов:    {len(tickets_df)}")
-    print(f"  Менеджеров: {len(managers_df)}")
-    print(f"  Офисов:     {len(units_df)}\n")
+    # Таблицы из schema.sql (в т.ч. ai_cache) могут отсутствовать на старом томе БД
+    init_db()
+
+    # Одно соединение из пула на все шаги: чтение, кеш AI, сохранение.
+    # Менеджеры и офисы нужны только маршрутизации — читаем их в фоне
+    # (на своём соединении из пула), пока идёт обогащение.
+    with pooled_connection() as conn, ThreadPoolExecutor(max_workers=1) as background:
+        print("Читаем данные из БД...")
+        tickets_df = get_tickets_df(conn)
+        references = background.submit(get_reference_dfs)
+        print(f"  Тикетов:    {len(tickets_df)}\n")
+
+        enricher = TicketEnricher()
+        records = tickets_df.to_dict("records")
+        ai_rows = [None] * len(records)  # только AI-поля; колонки тикетов не копируем
+
+        # Одинаковые (текст, город, сегмент) обогащаем один раз и раздаём всем копиям
+        inputs = [_enricher_input(row) for row in records]
+        groups = {}
+        for i, inp in enumerate(inputs):
+            groups.setdefault((inp["text"], inp["city"], inp["segment"]), []).append(i)
+
+        # В LLM-режиме summary/recommendation уже виденных текстов берём из ai_cache,
+        # остальные поля досчитываем rule-based. Rule-based summary не кешируем:
+        # он дешёвый и не должен подменять ответ LLM.
+        keys = [_cache_key(inp) for inp in inputs] if api_key else []
+        cached = get_ai_cache(keys, conn) if keys else {}
+        misses = []
+        for idx in groups.values():
+            llm = cached.get(keys[idx[0]]) if cached else None
+            if llm is None:
+                misses.append(idx)
+                continue
+            ai_data = enricher.enrich_with_summary(inputs[idx[0]], llm)
+            for i in idx:
+                ai_rows[i] = ai_data
+        n_misses = sum(len(idx) for idx in misses)
+        if cached:
+            print(f"  Из кеша: {len(records) - n_misses}/{len(records)}")
+        batches = list(_chunks([records[idx[0]] for idx in misses], BATCH_SIZE))
+
+        print(f"Запускаем AI-обогащение ({len(misses)} уникальных из {n_misses} тикетов, "
+              f"{len(batches)} пачек по {BATCH_SIZE}, до {MAX_WORKERS} одновременно)...")
+        t_enrich_start = time.time()
+        fresh = {}
+        for idx, ai_data in zip(misses, asyncio.run(enrich_all(enricher, batches))):
+            if ai_data.get("llm_used") and keys:
+                fresh[keys[idx[0]]] = {k: ai_data[k] for k in _CACHED_LLM_FIELDS}
+            for i in idx:
+                ai_rows[i] = ai_data
+        save_ai_cache(fresh, conn)
+        total_enrich_time = time.time() - t_enrich_start
+        # AI-поля — колонками рядом с исходными тикетами, без DataFrame из списка dict'ов
+        enriched_df = tickets_df.assign(**{
+            field: [ai_data[field] for ai_data in ai_rows] for field in _FALLBACK_AI
+        })
 
-    enricher = TicketEnricher()
-    enriched_rows = [None] * len(tickets_df)  # список фиксированного размера — сохраняем порядок
-    rows_list = [(i, row) for i, (_, row) in enumerate(tickets_df.iterrows())]
+        managers_df, units_df = references.result()
+        print(f"\n  Менеджеров: {len(managers_df)}")
+        print(f"  Офисов:     {len(units_df)}")
 
-    print(f"Запускаем AI-обогащение ({len(tickets_df)} тикетов, {MAX_WORKERS} потоков)...")
-    t_enrich_start = time.time()
-    done = 0
+        print("\nЗапускаем маршрутизацию...")
+        t_routing = time.time()
+        engine = FIREEngine(enriched_df, managers_df, units_df)
+        # save_results сам сериализует trace — оставляем словари
+        result_df = engine.distribute(trace_format="dict")
+        routing_elapsed = time.time() - t_routing
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Запускаем все задачи сразу
-        future_to_idx = {
-            executor.submit(enrich_one, enricher, row): idx
-            for idx, row in rows_list
-        }
-
-        # Собираем результаты по мере готовности
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
-            enriched_rows[idx] = future.result()
-            done += 1
-            if done % 5 == 0 or done == len(tickets_df):
-                elapsed = time.time() - t_enrich_start
-                print(f"  Обогащено: {done}/{len(tickets_df)} | {elapsed:.1f}s итого")
-
-    total_enrich_time = time.time() - t_enrich_start
-    enriched_df = pd.DataFrame(enriched_rows)
-
-    print("\nЗапускаем маршрутизацию...")
-    t_routing = time.time()
-    engine = FIREEngine(enriched_df, managers_df, units_df)
-    result_df = engine.distribute()
-    routing_elapsed = time.time() - t_routing
-
-    save_results(result_df)
+        save_results(result_df, conn)
 
     escalations = (result_df["manager"] == "CAPITAL_ESCALATION").sum()
 
@@ -69,6 +69,14 @@ CREATE TABLE IF NOT EXISTS assignments (
     assigned_at     TIMESTAMP DEFAULT NOW()
 );
 
+-- 6. Кеш AI-обогащения (переживает перезагрузку CSV)
+--    hash — blake2b(версия | модель | текст | город | сегмент)
+CREATE TABLE IF NOT EXISTS ai_cache (
+    hash        BYTEA PRIMARY KEY,
+    payload     JSONB NOT NULL,
+    created_at  TIMESTAMP DEFAULT NOW()
+);
+
 -- Индексы
 CREATE INDEX IF NOT EXISTS idx_tickets_guid        ON tickets(guid);
 CREATE INDEX IF NOT EXISTS idx_ai_type             ON ai_analysis(ai_type);
@@ -0,0 +1,190 @@
+import datetime
+import io
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+from db import _BINARY_ENCODERS, _PGCOPY_HEADER, _PGCOPY_TRAILER, _copy_rows
+
+
+class FakeCursor:
+    """copy_expert сохраняет поток; fetchall отдаёт заранее заданные результаты по очереди."""
+
+    def __init__(self, results=()):
+        self.sql = None
+        self.data = None
+        self.executed = []
+        self.results = list(results)
+
+    def copy_expert(self, sql, f):
+        self.sql = sql
+        self.data = f.read()
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+
+def _field(data: bytes) -> bytes:
+    return struct.pack("!i", len(data)) + data
+
+
+def test_copy_rows_binary_layout():
+    cur = FakeCursor()
+    columns = (
+        ("id", "int4"), ("score", "float8"), ("name", "text"),
+        ("trace", "jsonb"), ("created", "date"), ("note", "text"),
+    )
+    rows = [
+        (7, 1.5, "Алматы", '{"a": 1}', datetime.date(2000, 1, 2), None),
+        (None, None, "", None, datetime.date(1999, 12, 31), "x"),
+    ]
+    _copy_rows(cur, "t", columns, rows)
+
+    expected = (
+        _PGCOPY_HEADER
+        + struct.pack("!h", 6)
+        + _field(struct.pack("!i", 7))
+        + _field(struct.pack("!d", 1.5))
+        + _field("Алматы".encode())
+        + _field(b'\x01{"a": 1}')
+        + _field(struct.pack("!i", 1))
+        + struct.pack("!i", -1)
+        + struct.pack("!h", 6)
+        + struct.pack("!i", -1)
+        + struct.pack("!i", -1)
+        + _field(b"")
+        + struct.pack("!i", -1)
+        + _field(struct.pack("!i", -1))
+        + _field(b"x")
+        + _PGCOPY_TRAILER
+    )
+    assert cur.data == expected
+    assert cur.sql == "COPY t (id, score, name, trace, created, note) FROM STDIN WITH (FORMAT binary)"
+
+
+def test_copy_rows_empty():
+    cur = FakeCursor()
+    _copy_rows(cur, "t", (("id", "int4"),), [])
+    assert cur.data == _PGCOPY_HEADER + _PGCOPY_TRAILER
+
+
+def test_header_and_trailer():
+    assert _PGCOPY_HEADER == b"PGCOPY\n\xff\r\n\x00" + b"\x00" * 8
+    assert _PGCOPY_TRAILER == b"\xff\xff"
+
+
+def test_scalar_encoders():
+    assert _BINARY_ENCODERS["int2"](-2) == b"\xff\xfe"
+    assert _BINARY_ENCODERS["int4"](258) == b"\x00\x00\x01\x02"
+    assert _BINARY_ENCODERS["float8"](-0.5) == struct.pack("!d", -0.5)
+    assert _BINARY_ENCODERS["bool"](True) == b"\x01"
+    assert _BINARY_ENCODERS["bool"](False) == b"\x00"
+    assert _BINARY_ENCODERS["bytea"](b"\x00\xff") == b"\x00\xff"
+    assert _BINARY_ENCODERS["jsonb"]("{}") == b"\x01{}"
+    assert _BINARY_ENCODERS["date"](datetime.date(2000, 1, 1)) == b"\x00\x00\x00\x00"
+
+
+def test_text_array_encoder():
+    assert _BINARY_ENCODERS["text[]"]([]) == struct.pack("!iii", 0, 0, 25)
+    data = io.BytesIO(_BINARY_ENCODERS["text[]"](["VIP", "KZ"]))
+    ndim, has_null, oid, length, lbound = struct.unpack("!iiiii", data.read(20))
+    assert (ndim, has_null, oid, length, lbound) == (1, 0, 25, 2, 1)
+    items = []
+    for _ in range(length):
+        (n,) = struct.unpack("!i", data.read(4))
+        items.append(data.read(n).decode())
+    assert items == ["VIP", "KZ"]
+    assert data.read() == b""
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """save_results на фейковом соединении → {таблица: (колонки, строки)} из _copy_rows."""
+    copies = {}
+    real_copy_rows = db._copy_rows
+
+    def recording_copy_rows(cur, table, columns, rows):
+        copies[table] = ([name for name, _ in columns], rows)
+        real_copy_rows(cur, table, columns, rows)  # кодирование не должно падать
+
+    monkeypatch.setattr(db, "_copy_rows", recording_copy_rows)
+    result_df = pd.DataFrame([
+        {"guid": "g1", "ai_type": "Жалоба", "ai_lang": "RU", "sentiment": "NEG", "priority": 9,
+         "summary": "s1", "recommendation": "r1", "lat": 43.25, "lon": 76.95,
+         "office": "Алматы", "manager": "Иванов", "office_reason": "nearest",
+         "distance_km": 1.5, "trace": {"load": np.int64(3)}},
+        {"guid": "g2", "ai_type": "Консультация", "ai_lang": "KZ", "sentiment": "NEU", "priority": None,
+         "summary": "s2", "recommendation": "r2", "lat": None, "lon": np.nan,
+         "office": "Астана", "manager": "CAPITAL_ESCALATION", "office_reason": "escalation",
+         "distance_km": np.nan, "trace": '{"step": "escalation"}'},
+        {"guid": "missing", "ai_type": "Жалоба", "ai_lang": "RU", "sentiment": "NEG", "priority": 5,
+         "summary": "", "recommendation": "", "lat": 1.0, "lon": 2.0,
+         "office": "Алматы", "manager": "Иванов", "office_reason": "", "distance_km": 0.0, "trace": {}},
+        {"guid": "g4", "ai_type": None, "ai_lang": "ENG", "sentiment": "POS", "priority": "7",
+         "summary": None, "recommendation": "r4", "lat": 51.1, "lon": 71.4,
+         "office": "Неизвестный", "manager": "Петров", "office_reason": None,
+         "distance_km": 2.0, "trace": {}},
+    ])
+    cur = FakeCursor(results=[
+        [("office", "Алматы", 1), ("office", "Астана", 2), ("manager", "Иванов", 10),
+         ("ticket", "g1", 100), ("ticket", "g2", 101), ("ticket", "g4", 104)],
+        [(500,), (501,), (502,)],
+    ])
+    conn = FakeConnection(cur)
+    db.save_results(result_df, conn)
+    return copies, cur, conn
+
+
+def test_save_results_ai_analysis_rows(saved):
+    copies, cur, conn = saved
+    columns, rows = copies["ai_analysis"]
+    assert columns == ["id", "ticket_id", "ai_type", "ai_lang", "sentiment", "priority",
+                       "summary", "recommendation", "lat", "lon"]
+    assert rows == [
+        (500, 100, "Жалоба", "RU", "NEG", 9, "s1", "r1", 43.25, 76.95),
+        (501, 101, "Консультация", "KZ", "NEU", 5, "s2", "r2", None, None),
+        (502, 104, "", "ENG", "POS", 7, "", "r4", 51.1, 71.4),
+    ]
+    # id ai_analysis выделены заранее — ровно по одному на найденный тикет
+    nextval_sql, nextval_params = cur.executed[1]
+    assert "nextval('ai_analysis_id_seq')" in nextval_sql and nextval_params == (3,)
+    assert conn.committed
+
+
+def test_save_results_assignment_rows(saved):
+    copies, _, _ = saved
+    columns, rows = copies["assignments"]
+    assert columns == ["ticket_id", "ai_analysis_id", "manager_id", "office_id",
+                       "office_reason", "distance_km", "is_escalation", "trace"]
+    assert [row[:7] for row in rows] == [
+        (100, 500, 10, 1, "nearest", 1.5, False),
+        (101, 501, None, 2, "escalation", None, True),
+        (104, 502, None, None, "", 2.0, False),
+    ]
+    assert [json.loads(row[7]) for row in rows] == [{"load": 3}, {"step": "escalation"}, {}]
+    assert all(type(v) is int for row in rows for v in row[:4] if v is not None)
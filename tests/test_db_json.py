@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+import pytest
+
+import db
+
+
+TRACE = {
+    "load": np.int64(3),
+    "distance_km": np.float64(12.5),
+    "vip": np.bool_(True),
+    "candidates": np.array([1, 2]),
+    "office": "Алматы",
+}
+EXPECTED = {"load": 3, "distance_km": 12.5, "vip": True, "candidates": [1, 2], "office": "Алматы"}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_dumps_accepts_numpy(monkeypatch, use_orjson):
+    if use_orjson and not db.ORJSON_AVAILABLE:
+        pytest.skip("orjson not installed")
+    monkeypatch.setattr(db, "ORJSON_AVAILABLE", use_orjson)
+    assert json.loads(db._json_dumps(TRACE)) == EXPECTED
+
+
+def test_json_dumps_keeps_cyrillic():
+    assert "Алматы" in db._json_dumps({"office": "Алматы"})
+
+
+def test_json_dumps_still_rejects_unknown_objects(monkeypatch):
+    monkeypatch.setattr(db, "ORJSON_AVAILABLE", False)
+    with pytest.raises(TypeError):
+        db._json_dumps({"x": object()})
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import FIREEngine
+
+
+def _managers():
+    return pd.DataFrame({
+        "ФИО": ["Ахметов А", "Беков Б", "Волкова В", "Гаврилов Г", "Даулет Д",
+                "Ержан Е", "Жанна Ж", "Зейнулла З", "Ирина И"],
+        "Должность ": ["Главный специалист", "Специалист", "Ведущий специалист",
+                       "Специалист", "Главный специалист", "Специалист",
+                       "Ведущий специалист", "Специалист", "Специалист"],
+        "Офис": ["Астана", "Астана", "Астана", "Алматы", "Алматы", "Алматы",
+                 "Шымкент", "Шымкент", "Караганда"],
+        "Навыки": ["VIP, KZ", "ENG", "KZ", "VIP, ENG", "VIP; KZ", None, "KZ", "", ""],
+        "Количество обращений в работе": [3, 1, 2, 0, 6, 1, 0, 5, 2],
+    })
+
+
+def _units():
+    # Павлодар и Актобе — офисы без менеджеров, в Караганде один менеджер без навыков
+    return pd.DataFrame({
+        "Офис": ["Астана", "Алматы", "Шымкент", "Караганда", "Павлодар", "Актобе"],
+        "Адрес": ["a", "b", "c", "d", "e", "f"],
+    })
+
+
+def _tickets(n=40, seed=7):
+    rng = np.random.default_rng(seed)
+    city = rng.choice(np.array(["Астана", "Алматы", "Шымкент", "Караганда", "Павлодар",
+                                "Актобе", "Неизвестный", "", "Москва"], dtype=object), n)
+    country = np.where(city == "Москва", "Россия",
+                       np.where(rng.random(n) < 0.1, "", "Казахстан"))
+    tickets = pd.DataFrame({
+        "guid": [f"t{i:02d}" for i in range(n)],
+        "city": city,
+        "country": country,
+        "segment": rng.choice(["Mass", "VIP", "Priority"], n, p=[0.5, 0.3, 0.2]),
+        "region": "",
+        "ai_type": rng.choice(["Консультация", "Смена данных", "Жалоба"], n),
+        "ai_lang": rng.choice(["RU", "KZ", "ENG"], n, p=[0.5, 0.3, 0.2]),
+        "priority": rng.integers(1, 11, n),
+        "lat": np.nan,
+        "lon": np.nan,
+    })
+    # У части обращений свои координаты (рядом с Павлодаром) — ветка by_coords
+    tickets.loc[::8, ["lat", "lon"]] = (52.3, 76.9)
+    return tickets
+
+
+# Эталон снят с исходного pandas-движка (до перехода на numpy-бакеты)
+EXPECTED = [
+    ("t00", "Астана", "nearest_office", "Ахметов А"),
+    ("t01", "Астана", "nearest_office", "Ахметов А"),
+    ("t02", "Астана", "default", "Ахметов А"),
+    ("t03", "Астана", "50_50", "Ахметов А"),
+    ("t04", "Астана", "nearest_office", "Волкова В"),
+    ("t05", "Астана", "default", "Ахметов А"),
+    ("t06", "Астана", "default", "Беков Б"),
+    ("t07", "Алматы", "nearest_office", "Даулет Д"),
+    ("t08", "Астана", "nearest_office", "Ахметов А"),
+    ("t09", "Шымкент", "by_distance", "Жанна Ж"),
+    ("t10", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t11", "Астана", "default", "Ахметов А"),
+    ("t12", "Алматы", "50_50", "Гаврилов Г"),
+    ("t13", "Астана", "by_distance", "Ахметов А"),
+    ("t14", "Астана", "nearest_office", "Беков Б"),
+    ("t15", "Астана", "default", "Ахметов А"),
+    ("t16", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t17", "Астана", "default", "Ахметов А"),
+    ("t18", "Алматы", "by_distance", "Даулет Д"),
+    ("t19", "Астана", "nearest_office", "Ахметов А"),
+    ("t20", "Астана", "default", "Ахметов А"),
+    ("t21", "Алматы", "nearest_office", "Даулет Д"),
+    ("t22", "Астана", "nearest_office", "Ахметов А"),
+    ("t23", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t24", "Астана", "nearest_office", "Ахметов А"),
+    ("t25", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t26", "Астана", "50_50", "Ахметов А"),
+    ("t27", "Астана", "nearest_office", "Беков Б"),
+    ("t28", "Астана", "nearest_office", "Волкова В"),
+    ("t29", "Астана", "nearest_office", "Беков Б"),
+    ("t30", "Астана", "nearest_office", "Ахметов А"),
+    ("t31", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t32", "Астана", "nearest_office", "Волкова В"),
+    ("t33", "Алматы", "50_50", "Даулет Д"),
+    ("t34", "Астана", "default", "Ахметов А"),
+    ("t35", "Алматы", "nearest_office", "Гаврилов Г"),
+    ("t36", "Астана", "default", "Беков Б"),
+    ("t37", "Астана", "nearest_office", "Ахметов А"),
+    ("t38", "Караганда", "by_match", "Ирина И"),
+    ("t39", "Астана", "50_50", "Волкова В"),
+]
+
+EXPECTED_LOADS = {
+    "Ахметов А": 21,
+    "Беков Б": 6,
+    "Волкова В": 6,
+    "Гаврилов Г": 7,
+    "Даулет Д": 10,
+    "Ержан Е": 1,
+    "Жанна Ж": 1,
+    "Зейнулла З": 5,
+    "Ирина И": 3,
+}
+
+
+def test_distribute_matches_reference_assignments():
+    engine = FIREEngine(_tickets(), _managers(), _units())
+    res = engine.distribute(trace_format="dict")
+
+    got = list(zip(res["guid"], res["office"], res["office_reason"], res["manager"]))
+    assert got == EXPECTED
+    assert dict(zip(engine.managers["name"], engine.managers["load"].tolist())) == EXPECTED_LOADS
+
+    # Офисы без менеджеров остаются домашними в trace, обращение уходит в ближайший
+    homes = {t["home_office"] for t in res["trace"] if "redirected_to_office" in t}
+    assert {"Павлодар", "Актобе", "Караганда"} <= homes
+    assert "Павлодар" not in set(res["office"])
+
+
+# ── выбор менеджера ─────────────────────────────────────────────────────────
+
+def _office_engine(loads):
+    """Движок с одним офисом, менеджеры m0, m1, … с заданной нагрузкой."""
+    managers = pd.DataFrame({
+        "ФИО": [f"m{i}" for i in range(len(loads))],
+        "Должность ": "Специалист",
+        "Офис": "Астана",
+        "Навыки": "",
+        "Количество обращений в работе": loads,
+    })
+    return FIREEngine(_tickets(n=1), managers, _units())
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_select_manager_top2_is_two_smallest_by_load_then_name(seed):
+    loads = np.random.default_rng(seed).integers(0, 4, 7).tolist()
+    engine = _office_engine(loads)
+    bucket = engine._bucket("Астана")
+    cand = bucket["combos"][(False, False, None)]
+
+    _, top2 = engine._select_manager(bucket, cand, "RU")
+
+    assert top2 == [name for _, name in sorted(zip(loads, bucket["name"]))[:2]]
+
+
+def test_select_manager_large_spread_takes_least_loaded():
+    engine = _office_engine([5, 0, 1])
+    bucket = engine._bucket("Астана")
+    cand = bucket["combos"][(False, False, None)]
+
+    picked = [engine._select_manager(bucket, cand, "RU")[0] for _ in range(3)]
+
+    # Разброс 5 > 3: пока он не сократится, RR не участвует
+    assert picked == ["m1", "m1", "m2"]
+    engine._sync_loads()
+    assert engine.managers["load"].tolist() == [5, 2, 2]
+
+
+def test_round_robin_counter_per_office_and_language():
+    engine = _office_engine([0, 0])
+    bucket = engine._bucket("Астана")
+    cand = bucket["combos"][(False, False, None)]
+
+    picked = [engine._select_manager(bucket, cand, lang)[0] for lang in ("RU", "KZ", "RU")]
+
+    # У KZ свой счётчик: общий на офис дал бы m0, m1, m0
+    assert picked == ["m0", "m1", "m1"]
+    oid = bucket["id"]
+    assert engine._rr[oid, engine._lang_ids["RU"]] == 2
+    assert engine._rr[oid, engine._lang_ids["KZ"]] == 1
+    assert engine._rr[engine._empty_bucket["id"]].sum() == 0
+
+
+def test_round_robin_counters_grow_for_new_languages():
+    engine = _office_engine([0, 0])
+    bucket = engine._bucket("Астана")
+    cand = bucket["combos"][(False, False, None)]
+    engine._select_manager(bucket, cand, "RU")
+    cols = engine._rr.shape[1]
+
+    for k in range(cols):
+        engine._select_manager(bucket, cand, f"L{k}")
+
+    assert engine._rr.shape[1] > cols
+    assert engine._rr[bucket["id"], engine._lang_ids["RU"]] == 1
+    assert all(engine._rr[bucket["id"], engine._lang_ids[f"L{k}"]] == 1 for k in range(cols))
+
+
+# ── кеши ближайшего офиса и проходов фильтра ────────────────────────────────
+
+def _brute_nearest(engine, lat, lon, exclude=None):
+    dist = {
+        off: round(engine.geo.distance_km(lat, lon, o_lat, o_lon), 2)
+        for off, (o_lat, o_lon) in engine._office_coords.items() if off != exclude
+    }
+    best = min(dist, key=dist.get)
+    return best, dist[best]
+
+
+POINTS = [(52.3, 76.9), (43.2, 76.9), (42.3, 69.6), (50.3, 57.2), (47.1, 51.9)]
+
+
+def test_nearest_cache_matches_brute_force():
+    engine = FIREEngine(_tickets(), _managers(), _units())
+    engine._fill_nearest_cache(POINTS + POINTS[:2])
+
+    assert set(engine._nearest_cache) >= set(POINTS)
+    for lat, lon in POINTS:
+        assert engine._nearest_office_by_coords(lat, lon) == _brute_nearest(engine, lat, lon)
+        office, _ = _brute_nearest(engine, lat, lon)
+        assert engine._nearest_office_by_coords(lat, lon, exclude=office) == \
+            _brute_nearest(engine, lat, lon, exclude=office)
+
+
+def test_distribute_fills_nearest_cache_for_own_and_geocoded_coords():
+    engine = FIREEngine(_tickets(), _managers(), _units())
+    engine.distribute()
+
+    # Свои координаты обращений и координаты геокодированных городов
+    assert (52.3, 76.9) in engine._nearest_cache
+    assert engine._geocode("Шымкент", "") in engine._nearest_cache
+    for (lat, lon), cached in engine._nearest_cache.items():
+        assert cached == _brute_nearest(engine, lat, lon)
+
+
+@pytest.mark.parametrize("profile, expected", [
+    (("MASS", "Консультация", "RU"), [(False, False, None), (False, False, None)]),
+    (("MASS", "Консультация", "KZ"),
+     [(False, False, "KZ"), (False, False, None), (False, False, None)]),
+    (("VIP", "Смена данных", "ENG"),
+     [(True, True, "ENG"), (True, True, None), (True, False, None), (False, False, None)]),
+    (("PRIORITY", "Жалоба", "RU"), [(True, False, None), (True, False, None), (False, False, None)]),
+])
+def test_filter_passes_cached_per_profile(profile, expected):
+    engine = FIREEngine(_tickets(), _managers(), _units())
+    bucket = engine._bucket("Алматы")
+
+    passes = engine._filter_passes(*profile)
+
+    assert engine._filter_passes(*profile) is passes
+    assert [p(bucket).tolist() for p in passes] == [bucket["combos"][c].tolist() for c in expected]
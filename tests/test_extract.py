@@ -0,0 +1,149 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import gdrive_loader
+
+
+@pytest.fixture
+def extract_dir(tmp_path, monkeypatch):
+    path = tmp_path / "extracted"
+    path.mkdir()
+    monkeypatch.setattr(gdrive_loader, "EXTRACT_DIR", str(path))
+    return path
+
+
+def _zip(tmp_path, files: dict) -> str:
+    path = tmp_path / "archive.zip"
+    with zipfile.ZipFile(path, "w") as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+    return str(path)
+
+
+def _tar(tmp_path, members) -> str:
+    """members — (name, bytes[, mode]) для файлов или (name, linkname, tar-тип) для ссылок."""
+    path = tmp_path / "archive.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        for name, *rest in members:
+            info = tarfile.TarInfo(name)
+            if isinstance(rest[0], str):
+                info.linkname, info.type = rest
+                tar.addfile(info)
+            else:
+                info.size = len(rest[0])
+                if len(rest) == 2:
+                    info.mode = rest[1]
+                tar.addfile(info, io.BytesIO(rest[0]))
+    return str(path)
+
+
+def test_zip_extracts_and_skips_junk(tmp_path, extract_dir):
+    gdrive_loader.safe_extract_zip(_zip(tmp_path, {
+        "data/tickets.csv": "guid\n1\n",
+        "data/readme.txt": "junk",
+    }))
+    assert (extract_dir / "data" / "tickets.csv").read_text() == "guid\n1\n"
+    assert not (extract_dir / "data" / "readme.txt").exists()
+
+
+@pytest.mark.parametrize("name", ["../evil.csv", "data/../../evil.csv", "/tmp/evil.csv"])
+def test_zip_slip_rejected(tmp_path, extract_dir, name):
+    archive = _zip(tmp_path, {"ok.csv": "a", name: "b"})
+    with pytest.raises(Exception, match="Zip Slip"):
+        gdrive_loader.safe_extract_zip(archive)
+    # Проверка идёт до записи — не распаковано ничего
+    assert list(extract_dir.iterdir()) == []
+    assert not (tmp_path / "evil.csv").exists()
+
+
+def test_zip_through_symlinked_dir_rejected(tmp_path, extract_dir):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    os.symlink(outside, extract_dir / "link")
+    with pytest.raises(Exception, match="Zip Slip"):
+        gdrive_loader.safe_extract_zip(_zip(tmp_path, {"link/tickets.csv": "x"}))
+    assert list(outside.iterdir()) == []
+
+
+def test_tar_extracts_and_skips_junk(tmp_path, extract_dir):
+    gdrive_loader.safe_extract_tar(_tar(tmp_path, [
+        ("data/managers.csv", b"name\n"),
+        ("data/notes.md", b"junk"),
+        ("data/latest.csv", "managers.csv", tarfile.SYMTYPE),
+    ]))
+    assert (extract_dir / "data" / "managers.csv").read_bytes() == b"name\n"
+    assert not (extract_dir / "data" / "notes.md").exists()
+    assert (extract_dir / "data" / "latest.csv").read_bytes() == b"name\n"
+
+
+@pytest.mark.parametrize("name", ["../evil.csv", "/tmp/evil.csv"])
+def test_tar_path_traversal_rejected(tmp_path, extract_dir, name):
+    with pytest.raises(Exception, match="Path Traversal"):
+        gdrive_loader.safe_extract_tar(_tar(tmp_path, [(name, b"x")]))
+    assert not (tmp_path / "evil.csv").exists()
+
+
+@pytest.mark.parametrize("linkname, link_type", [
+    ("/etc/passwd", tarfile.SYMTYPE),
+    ("../../outside.csv", tarfile.SYMTYPE),
+    ("../outside.csv", tarfile.LNKTYPE),
+])
+def test_tar_link_outside_rejected(tmp_path, extract_dir, linkname, link_type):
+    with pytest.raises(Exception, match="link outside"):
+        gdrive_loader.safe_extract_tar(_tar(tmp_path, [("data/tickets.csv", linkname, link_type)]))
+    assert not os.path.lexists(extract_dir / "data" / "tickets.csv")
+
+
+def test_tar_write_through_symlink_rejected(tmp_path, extract_dir):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    os.symlink(outside, extract_dir / "link")
+    with pytest.raises(Exception, match="Path Traversal"):
+        gdrive_loader.safe_extract_tar(_tar(tmp_path, [("link/tickets.csv", b"x")]))
+    assert list(outside.iterdir()) == []
+
+
+def test_tar_hardlink_to_extracted_member(tmp_path, extract_dir):
+    gdrive_loader.safe_extract_tar(_tar(tmp_path, [
+        ("data/tickets.csv", b"guid\n"),
+        ("data/copy.csv", "data/tickets.csv", tarfile.LNKTYPE),
+    ]))
+    assert (extract_dir / "data" / "copy.csv").read_bytes() == b"guid\n"
+
+
+@pytest.mark.parametrize("members", [
+    # цель — мусор, который не распаковывался
+    [("data/readme.txt", b"junk"), ("data/tickets.csv", "data/readme.txt", tarfile.LNKTYPE)],
+    # цель идёт в архиве позже — в потоке её ещё нет
+    [("data/tickets.csv", "data/later.csv", tarfile.LNKTYPE), ("data/later.csv", b"x")],
+])
+def test_tar_hardlink_without_extracted_target_is_skipped(tmp_path, extract_dir, members):
+    gdrive_loader.safe_extract_tar(_tar(tmp_path, members))
+    assert not os.path.lexists(extract_dir / "data" / "tickets.csv")
+
+
+def test_tar_stream_error_skips_member(tmp_path, extract_dir, monkeypatch):
+    archive = _tar(tmp_path, [("data/bad.csv", b"x"), ("data/tickets.csv", b"guid\n")])
+    extract = tarfile.TarFile.extract
+
+    def flaky_extract(self, member, *args, **kwargs):
+        if member.name == "data/bad.csv":
+            raise tarfile.StreamError("seeking backwards is not allowed")
+        return extract(self, member, *args, **kwargs)
+
+    monkeypatch.setattr(tarfile.TarFile, "extract", flaky_extract)
+    gdrive_loader.safe_extract_tar(archive)
+    assert not (extract_dir / "data" / "bad.csv").exists()
+    assert (extract_dir / "data" / "tickets.csv").read_bytes() == b"guid\n"
+
+
+@pytest.mark.skipif(not hasattr(tarfile, "data_filter"), reason="tarfile without extraction filters")
+def test_tar_uses_data_filter(tmp_path, extract_dir):
+    gdrive_loader.safe_extract_tar(_tar(tmp_path, [("data/tickets.csv", b"x", 0o4777)]))
+    mode = (extract_dir / "data" / "tickets.csv").stat().st_mode
+    assert not mode & 0o4000  # setuid снят
+    assert not mode & 0o022   # запись для group/other снята
@@ -0,0 +1,155 @@
+import datetime
+
+import pytest
+
+import db
+
+
+@pytest.fixture(params=[True, False], ids=["pyarrow", "python"])
+def csv_engine(request, monkeypatch):
+    if request.param and not db.PYARROW_AVAILABLE:
+        pytest.skip("pyarrow not installed")
+    monkeypatch.setattr(db, "PYARROW_AVAILABLE", request.param)
+    return request.param
+
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    # utf-8-sig: выгрузки из Excel приходят с BOM
+    path.write_text(text, encoding="utf-8-sig")
+    return str(path)
+
+
+def test_read_csv_keeps_needed_columns_as_strings(tmp_path, csv_engine):
+    path = _write(tmp_path, "managers.csv",
+                  "ФИО ,Должность,Офис,Навыки,Количество обращений в работе,Лишняя\n"
+                  "Иванов,Ведущий специалист,Алматы,\"VIP, KZ\",007,x\n"
+                  "Петров,,Астана,,,y\n")
+    df = db._read_csv(path, db._MANAGER_COLUMNS)
+    assert sorted(df.columns) == sorted(db._MANAGER_COLUMNS)
+    assert df.to_dict("records") == [
+        {"фио": "Иванов", "должность": "Ведущий специалист", "офис": "Алматы",
+         "навыки": "VIP, KZ", "количество обращений в работе": "007"},
+        {"фио": "Петров", "должность": "", "офис": "Астана",
+         "навыки": "", "количество обращений в работе": ""},
+    ]
+
+
+def test_read_csv_normalizes_header_case_and_yo(tmp_path, csv_engine):
+    path = _write(tmp_path, "units.csv", "ОФИС,Адрёс\nАлматы,пр. Абая 1\n")
+    df = db._read_csv(path, db._UNIT_COLUMNS)
+    assert df.to_dict("records") == [{"офис": "Алматы", "адрес": "пр. Абая 1"}]
+
+
+def test_read_csv_missing_columns_are_not_invented(tmp_path, csv_engine):
+    path = _write(tmp_path, "units.csv", "Офис\nАлматы\n")
+    df = db._read_csv(path, db._UNIT_COLUMNS)
+    # Недостающие колонки дозаполняет load_csv через reindex
+    assert list(df.columns) == ["офис"]
+
+
+class _Cursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Conn:
+    def __init__(self):
+        self.cur = _Cursor()
+        self.committed = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+
+class _Pool:
+    def __init__(self):
+        self.conn = _Conn()
+        self.returned = False
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        self.returned = True
+
+
+@pytest.fixture
+def loaded(tmp_path, monkeypatch):
+    """load_csv на фейковом пуле → {таблица: (колонки, строки, on_conflict)} из _copy_via_stage."""
+    staged = {}
+
+    def copy_via_stage(cur, table, columns, rows, on_conflict, returning=None):
+        staged[table] = ([name for name, _ in columns], rows, on_conflict)
+        if table == "offices":
+            return [(row[0], i) for i, row in enumerate(rows, start=1)]
+        return None
+
+    pool = _Pool()
+    monkeypatch.setattr(db, "_pool", lambda: pool)
+    monkeypatch.setattr(db, "_copy_via_stage", copy_via_stage)
+    db.load_csv(
+        tickets_path=_write(tmp_path, "tickets.csv",
+            "GUID клиента,Пол клиента,Дата рождения,Описание,Сегмент клиента,Страна,Населенный пункт\n"
+            " g1 ,Мужской,1990-05-17,Не проходит перевод,VIP,Казахстан,Алматы\n"
+            "g2,Женский,не указана,Вопрос,Mass,Казахстан,Астана\n"
+            "  ,Мужской,1980-01-01,Без guid,Mass,Казахстан,Алматы\n"),
+        managers_path=_write(tmp_path, "managers.csv",
+            "ФИО,Должность,Офис,Навыки,Количество обращений в работе\n"
+            "Иванов , Главный специалист ,Алматы,\"VIP; ENG, KZ\",3\n"
+            "Петров,Специалист,Нигде,,abc\n"),
+        units_path=_write(tmp_path, "units.csv",
+            "Офис,Адрес\n"
+            "Алматы,старый адрес\n"
+            "Астана,пр. Мангилик Ел 55\n"
+            "Алматы,пр. Абая 1\n"),
+    )
+    return staged, pool
+
+
+def test_load_csv_offices_last_row_wins(loaded):
+    staged, _ = loaded
+    columns, rows, on_conflict = staged["offices"]
+    assert columns == ["name", "address", "lat", "lon"]
+    assert [row[:2] for row in rows] == [("Алматы", "пр. Абая 1"), ("Астана", "пр. Мангилик Ел 55")]
+    assert all(isinstance(row[2], float) and isinstance(row[3], float) for row in rows)
+    assert "DO UPDATE" in on_conflict
+
+
+def test_load_csv_manager_rows(loaded):
+    staged, _ = loaded
+    columns, rows, on_conflict = staged["managers"]
+    assert columns == ["name", "position", "office_id", "skills", "load"]
+    assert rows == [
+        ("Иванов", "Главный специалист", 1, ["VIP", "ENG", "KZ"], 3),
+        ("Петров", "Специалист", None, [], 0),
+    ]
+    assert on_conflict == "(name) DO NOTHING"
+
+
+def test_load_csv_ticket_rows(loaded):
+    staged, pool = loaded
+    columns, rows, on_conflict = staged["tickets"]
+    assert columns == ["guid", "gender", "birth_date", "description", "attachment", "segment",
+                       "country", "region", "city", "street", "house"]
+    assert rows == [
+        ("g1", "Мужской", datetime.date(1990, 5, 17), "Не проходит перевод",
+         "", "VIP", "Казахстан", "", "Алматы", "", ""),
+        ("g2", "Женский", None, "Вопрос", "", "Mass", "Казахстан", "", "Астана", "", ""),
+    ]
+    assert on_conflict == "(guid) DO NOTHING"
+    # Одна транзакция без ожидания fsync, соединение вернулось в пул
+    assert pool.conn.cur.executed[0] == "SET LOCAL synchronous_commit = off"
+    assert pool.conn.committed and pool.returned
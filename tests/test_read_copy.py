@@ -0,0 +1,76 @@
+import psycopg2.extensions
+import pytest
+
+import db
+
+
+class CopyOutCursor:
+    """copy_expert пишет в буфер заранее заданный вывод COPY ... TO STDOUT."""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.sql = None
+
+    def copy_expert(self, sql, f):
+        self.sql = sql
+        f.write(self.output.encode())
+
+
+def test_read_copy_strings_nulls_and_empty():
+    cur = CopyOutCursor(
+        "guid,city,house\n"
+        "g1,Алматы,\"\"\n"
+        "g2,\\N,12\n"
+        "007,\"Нур-Султан, центр\",\\N\n"
+    )
+    df = db._read_copy(cur, "SELECT guid, city, house FROM tickets")
+    assert cur.sql == (
+        "COPY (SELECT guid, city, house FROM tickets) TO STDOUT "
+        "WITH (FORMAT csv, HEADER true, NULL '\\N')"
+    )
+    assert df.to_dict("records") == [
+        {"guid": "g1", "city": "Алматы", "house": ""},
+        {"guid": "g2", "city": None, "house": "12"},
+        {"guid": "007", "city": "Нур-Султан, центр", "house": None},
+    ]
+    # Всё строками, как у read_sql по текстовым колонкам: без вывода типов
+    assert all(dtype == object for dtype in df.dtypes)
+
+
+def test_read_copy_empty_result_keeps_columns():
+    df = db._read_copy(CopyOutCursor("name,address\n"), db._OFFICES_SQL)
+    assert list(df.columns) == ["name", "address"]
+    assert df.empty
+
+
+def test_managers_frame_converts_load():
+    load = "Количество обращений в работе"
+    cur = CopyOutCursor(f"ФИО,Офис,{load}\nИванов,Алматы,3\nПетров,\\N,0\n")
+    df = db._managers_frame(cur)
+    assert df[load].tolist() == [3, 0]
+    assert df["Офис"].tolist() == ["Алматы", None]
+
+
+@pytest.mark.parametrize("reader", [db.get_tickets_df, db.get_managers_df, db.get_offices_df])
+def test_readers_use_the_given_connection(monkeypatch, reader):
+    class Conn:
+        autocommit = False
+        info = type("Info", (), {"transaction_status": psycopg2.extensions.TRANSACTION_STATUS_IDLE})()
+
+        def cursor(self):
+            return _Ctx(CopyOutCursor("a,Количество обращений в работе\nx,1\n"))
+
+    class _Ctx:
+        def __init__(self, cur):
+            self.cur = cur
+
+        def __enter__(self):
+            return self.cur
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(db, "_pool", lambda: pytest.fail("pool used although conn was given"))
+    conn = Conn()
+    assert len(reader(conn)) == 1
+    assert conn.autocommit is False  # режим соединения восстановлен
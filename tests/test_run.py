@@ -0,0 +1,151 @@
+import contextlib
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import run
+
+
+def _inp(text="Не проходит перевод", city="Алматы", segment="VIP"):
+    return {"text": text, "city": city, "segment": segment}
+
+
+# ── ключ ai_cache ───────────────────────────────────────────────────────────
+
+def test_cache_key_is_stable(monkeypatch):
+    monkeypatch.setattr(run, "AI_CACHE_VERSION", 2)
+    monkeypatch.setattr(run, "LLM_MODEL", "model")
+    key = run._cache_key(_inp())
+    assert key == run._cache_key(_inp())
+    assert len(key) == 16
+    # Ключи уже лежат в ai_cache — хеш не должен меняться между версиями Python/процессами
+    assert key.hex() == "6acf301e15db4efbafbd4cad5fca03dc"
+
+
+def test_cache_key_depends_only_on_text():
+    assert run._cache_key(_inp()) == run._cache_key(_inp(city="Астана", segment="Mass"))
+    assert run._cache_key(_inp()) != run._cache_key(_inp(text="Не проходит перевод!"))
+
+
+def test_cache_key_changes_with_version_and_model(monkeypatch):
+    key = run._cache_key(_inp())
+    monkeypatch.setattr(run, "AI_CACHE_VERSION", run.AI_CACHE_VERSION + 1)
+    bumped = run._cache_key(_inp())
+    assert bumped != key
+    monkeypatch.setattr(run, "LLM_MODEL", run.LLM_MODEL + "-next")
+    assert run._cache_key(_inp()) not in (key, bumped)
+
+
+# ── main(): кеш и обогащение на фейковой БД ─────────────────────────────────
+
+def _ai(ticket, summary):
+    return {
+        "ai_type": "Жалоба", "ai_lang": "RU", "sentiment": "NEG", "priority": 7,
+        "summary": summary, "recommendation": "r",
+        # rule-based поле зависит от города — видно, что оно считается заново
+        "lat": len(ticket["city"]), "lon": 0.0,
+        "llm_used": True,
+    }
+
+
+class FakeEnricher:
+    batches = []
+    from_cache = []
+
+    def __init__(self):
+        FakeEnricher.batches = []
+        FakeEnricher.from_cache = []
+
+    async def aenrich_batch(self, tickets):
+        FakeEnricher.batches.append([dict(t) for t in tickets])
+        return [_ai(t, "llm:" + t["text"]) for t in tickets]
+
+    def enrich_with_summary(self, ticket, llm):
+        FakeEnricher.from_cache.append((dict(ticket), llm))
+        return _ai(ticket, llm["summary"])
+
+
+class FakeEngine:
+    def __init__(self, enriched_df, managers_df, units_df):
+        self.enriched_df = enriched_df
+
+    def distribute(self, trace_format="json"):
+        return self.enriched_df.assign(office="Алматы", manager="Иванов")
+
+
+@pytest.fixture
+def run_main(monkeypatch):
+    """Запускает run.main() на заданных тикетах и кеше → результат, сохранённый кеш, чтения кеша."""
+    def _run(tickets, cache=None, api_key="key"):
+        saved, reads, results = {}, [], []
+        monkeypatch.setenv("OPENAI_API_KEY", api_key)
+        monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+        monkeypatch.setattr(run, "init_db", lambda: None)
+        monkeypatch.setattr(run, "pooled_connection", lambda: contextlib.nullcontext(object()))
+        monkeypatch.setattr(run, "get_tickets_df", lambda conn: pd.DataFrame(tickets))
+        monkeypatch.setattr(run, "get_reference_dfs", lambda: (pd.DataFrame(), pd.DataFrame()))
+
+        def get_ai_cache(keys, conn):
+            reads.append(list(keys))
+            return {k: v for k, v in (cache or {}).items() if k in set(keys)}
+
+        monkeypatch.setattr(run, "get_ai_cache", get_ai_cache)
+        monkeypatch.setattr(run, "save_ai_cache", lambda entries, conn: saved.update(entries))
+        monkeypatch.setattr(run, "save_results", lambda df, conn: results.append(df))
+        monkeypatch.setattr(run, "TicketEnricher", FakeEnricher)
+        monkeypatch.setattr(run, "FIREEngine", FakeEngine)
+        run.main()
+        return SimpleNamespace(result=results[0], saved=saved, cache_reads=reads)
+    return _run
+
+
+def _ticket(guid, text, city="Алматы", segment="Mass"):
+    return {"guid": guid, "description": text, "city": city, "segment": segment}
+
+
+def test_cached_summary_skips_llm_but_recomputes_rule_based_fields(run_main):
+    key = run._cache_key(_inp(text="B"))
+    out = run_main(
+        [_ticket("t1", "A"), _ticket("t2", "B", city="Шымкент")],
+        cache={key: {"summary": "cached:B", "recommendation": "r"}},
+    )
+    assert len(out.cache_reads) == 1  # один запрос к ai_cache на все тикеты
+    assert [t["text"] for batch in FakeEnricher.batches for t in batch] == ["A"]
+    assert [(t["text"], t["city"]) for t, _ in FakeEnricher.from_cache] == [("B", "Шымкент")]
+    assert out.result["summary"].tolist() == ["llm:A", "cached:B"]
+    assert out.result["lat"].tolist() == [len("Алматы"), len("Шымкент")]
+    # В кеш уходит только ответ LLM и только для новых текстов
+    assert out.saved == {run._cache_key(_inp(text="A")): {"summary": "llm:A", "recommendation": "r"}}
+
+
+def test_rule_based_mode_does_not_touch_cache(run_main):
+    out = run_main([_ticket("t1", "A")], api_key="")
+    assert out.cache_reads == []
+    assert out.saved == {}
+    assert out.result["summary"].tolist() == ["llm:A"]
+
+
+def test_duplicate_tickets_are_enriched_once(run_main):
+    tickets = [
+        _ticket("t1", "A"),
+        _ticket("t2", "A"),                    # точная копия t1
+        _ticket("t3", "A", city="Астана"),     # тот же текст, другой город
+        _ticket("t4", "A", segment="VIP"),     # тот же текст, другой сегмент
+        _ticket("t5", "C"),
+        _ticket("t6", "A"),
+    ]
+    out = run_main(tickets, api_key="")
+    sent = [(t["text"], t["city"], t["segment"]) for batch in FakeEnricher.batches for t in batch]
+    assert sent == [("A", "Алматы", "Mass"), ("A", "Астана", "Mass"), ("A", "Алматы", "VIP"), ("C", "Алматы", "Mass")]
+    # Копии получают результат своей группы, порядок тикетов сохранён
+    assert out.result["guid"].tolist() == ["t1", "t2", "t3", "t4", "t5", "t6"]
+    assert out.result["lat"].tolist() == [6, 6, 6, 6, 6, 6]
+    assert out.result["summary"].tolist() == ["llm:A"] * 4 + ["llm:C", "llm:A"]
+
+
+def test_enrichment_is_split_into_batches(run_main, monkeypatch):
+    monkeypatch.setattr(run, "BATCH_SIZE", 2)
+    out = run_main([_ticket(f"t{i}", f"text {i}") for i in range(5)], api_key="")
+    assert sorted(len(batch) for batch in FakeEnricher.batches) == [1, 2, 2]
+    assert out.result["summary"].tolist() == [f"llm:text {i}" for i in range(5)]